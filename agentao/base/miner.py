@@ -26,7 +26,7 @@ import bittensor as bt
 from agentao.base.neuron import BaseNeuron
 from agentao.utils.config import add_miner_args
 
-from typing import Union
+from typing import Dict, Union
 
 class BaseMinerNeuron(BaseNeuron):
     """
@@ -43,6 +43,10 @@ class BaseMinerNeuron(BaseNeuron):
     def __init__(self, config=None):
         super().__init__(config=config)
 
+        # Constant-time uid lookups for incoming requests, rebuilt whenever the metagraph is resynced
+        self.hotkey_to_uid: Dict[str, int] = {}
+        self.update_hotkey_to_uid()
+
         # Warn if allowing incoming requests from anyone.
         if not self.config.blacklist.force_validator_permit:
             bt.logging.warning(
@@ -184,9 +188,14 @@ class BaseMinerNeuron(BaseNeuron):
         """
         self.stop_run_thread()
 
+    def update_hotkey_to_uid(self):
+        """Rebuilds the hotkey -> uid mapping from the current metagraph."""
+        self.hotkey_to_uid = {hotkey: uid for uid, hotkey in enumerate(self.metagraph.hotkeys)}
+
     def resync_metagraph(self):
         """Resyncs the metagraph and updates the hotkeys and moving averages based on the new metagraph."""
         # bt.logging.info("resync_metagraph()")
 
         # Sync the metagraph.
         self.metagraph.sync(subtensor=self.subtensor)
+        self.update_hotkey_to_uid()
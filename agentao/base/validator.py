@@ -357,24 +357,19 @@ class BaseValidatorNeuron(BaseNeuron):
             # Replace any NaN values in rewards with 0.
             rewards = np.nan_to_num(rewards, nan=0)
 
-        # Check if `uids` is already a numpy array and copy it to avoid the warning.
-        if isinstance(uids, np.ndarray):
-            uids_tensor = uids.clone().detach()
-        else:
-            uids_tensor = np.array(uids)
+        uids_array = np.asarray(uids, dtype=np.intp)
 
         # Compute forward pass rewards, assumes uids are mutually exclusive.
-        # shape: [ metagraph.n ]
-        # Update scores with rewards produced by this step.
+        # Update scores with rewards produced by this step. Miners without a reward would blend
+        # their old score with itself, so only the rewarded entries are updated.
         # shape: [ metagraph.n ]
         alpha: float = self.config.neuron.moving_average_alpha
 
         def calculate_scores(old_scores: np.ndarray) -> np.ndarray:
-            scattered_rewards = np.copy(old_scores)  # Create a copy to modify
-            np.put_along_axis(scattered_rewards, uids_tensor, rewards, axis=0)
             bt.logging.debug(f"Scattered rewards: {rewards}")
 
-            scores = alpha * scattered_rewards + (1 - alpha) * old_scores
+            scores = np.copy(old_scores)
+            scores[uids_array] = alpha * rewards + (1 - alpha) * old_scores[uids_array]
             bt.logging.debug(f"New moving avg scores: {scores}")
             return scores
 
@@ -1,81 +1,153 @@
-from dataclasses import is_dataclass, dataclass, asdict, fields
+from dataclasses import is_dataclass, dataclass, fields
+from functools import lru_cache
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, Dict, TypedDict, Type, TypeVar, Union, get_origin, get_args
+from typing import Any, Dict, FrozenSet, Tuple, TypedDict, Type, TypeVar, Union, get_origin, get_args
 from typing import List, Callable, Optional
 
+import numpy as np
+import orjson
 from jinja2 import Template
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 T = TypeVar('T')
 
 # ================== Utils to for dataclass <-> dict parsing ===========================
+# Per-dataclass list of (field name, converter) pairs, built once on first use
+_CONVERTER_CACHE: Dict[type, List[Tuple[str, Callable[[Any], Any]]]] = {}
+# Field names of dataclasses whose fields need no conversion, see _build_converters
+_SCALAR_FIELD_NAMES: Dict[type, FrozenSet[str]] = {}
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _build_converters(cls: type) -> List[Tuple[str, Callable[[Any], Any]]]:
+    """Resolves the field types of a dataclass once and returns a converter for each field."""
+    converters = []
+    for field in fields(cls):
+        field_type = field.type
+
+        # Resolve Optional and Union types
+        if get_origin(field_type) is Union:
+            # Handle Optional (Union[X, None]) by extracting the actual type
+            actual_types = get_args(field_type)
+            if len(actual_types) == 2 and type(None) in actual_types:
+                actual_type = next(t for t in actual_types if t is not type(None))
+            else:
+                actual_type = None
+        else:
+            actual_type = field_type
+
+        # Check if the actual type is a dataclass or BaseModel
+        converter = _identity
+        if actual_type and isinstance(actual_type, type):
+            if is_dataclass(actual_type):
+                converter = lambda value, t=actual_type: dict_to_dataclass_or_basemodel(t, value) if value else None
+            elif issubclass(actual_type, BaseModel):
+                converter = lambda value, t=actual_type: t(**value) if value else None
+
+        converters.append((field.name, converter))
+
+    # No nested dataclass/BaseModel fields, so the data can be passed straight to the constructor
+    if all(converter is _identity for _, converter in converters):
+        _SCALAR_FIELD_NAMES[cls] = frozenset(name for name, _ in converters)
+
+    return converters
+
+
 def dict_to_dataclass_or_basemodel(cls: Type[T], data: Dict[str, Any]) -> T:
     """Recursively converts a dictionary into a dataclass or BaseModel instance, handling nested and optional fields."""
     if is_dataclass(cls):
-        init_kwargs = {}
-        for field in fields(cls):
-            field_name = field.name
-            field_type = field.type
-            field_value = data.get(field_name, None)  # Default to None if key is missing
-
-            # Resolve Optional and Union types
-            if get_origin(field_type) is Union:
-                # Handle Optional (Union[X, None]) by extracting the actual type
-                actual_types = get_args(field_type)
-                if len(actual_types) == 2 and type(None) in actual_types:
-                    actual_type = next(t for t in actual_types if t is not type(None))
-                else:
-                    actual_type = None
-            else:
-                actual_type = field_type
-
-            # Check if the actual type is a dataclass or BaseModel
-            if actual_type and isinstance(actual_type, type):
-                if is_dataclass(actual_type):
-                    init_kwargs[field_name] = dict_to_dataclass_or_basemodel(actual_type, field_value) if field_value else None
-                elif issubclass(actual_type, BaseModel):
-                    init_kwargs[field_name] = actual_type(**field_value) if field_value else None
-                else:
-                    init_kwargs[field_name] = field_value
-            else:
-                init_kwargs[field_name] = field_value
+        converters = _CONVERTER_CACHE.get(cls)
+        if converters is None:
+            converters = _CONVERTER_CACHE[cls] = _build_converters(cls)
 
-        return cls(**init_kwargs)
+        scalar_field_names = _SCALAR_FIELD_NAMES.get(cls)
+        if scalar_field_names is not None and data.keys() == scalar_field_names:
+            return cls(**data)
+
+        # Missing keys default to None
+        return cls(**{name: convert(data.get(name)) for name, convert in converters})
     elif issubclass(cls, BaseModel):
         return cls(**data)
     else:
         raise TypeError(f"{cls} is neither a dataclass nor a BaseModel.")
 
 
+# Per-class tuple of field names, used to walk dataclasses/BaseModels without copying them
+_FIELD_NAMES_CACHE: Dict[type, Tuple[str, ...]] = {}
+
+
+def _field_names(cls: type) -> Tuple[str, ...]:
+    names = _FIELD_NAMES_CACHE.get(cls)
+    if names is None:
+        if is_dataclass(cls):
+            names = tuple(field.name for field in fields(cls))
+        else:
+            names = tuple(cls.model_fields)
+        _FIELD_NAMES_CACHE[cls] = names
+    return names
+
+
 def convert_to_obj(data: Any) -> Any:
-    if is_dataclass(data):
-        return {k: convert_to_obj(v) for k, v in asdict(data).items()}
-    elif isinstance(data, BaseModel):
-        return {k: convert_to_obj(v) for k, v in data.dict().items()}
+    # Walk the fields directly rather than going through asdict()/dict(), which copy the whole tree first
+    if is_dataclass(data) or isinstance(data, BaseModel):
+        return {name: convert_to_obj(getattr(data, name)) for name in _field_names(type(data))}
     elif isinstance(data, list):
         return [convert_to_obj(item) for item in data]
     elif isinstance(data, dict):
         return {k: convert_to_obj(v) for k, v in data.items()}
     return data
+
+
+def _json_default(data: Any) -> Any:
+    if isinstance(data, BaseModel):
+        return data.model_dump()
+    elif isinstance(data, Path):
+        return str(data)
+    raise TypeError(f"Object of type {type(data).__name__} is not JSON serializable")
+
+
+def to_json_bytes(data: Any) -> bytes:
+    """
+    Serializes dataclasses, BaseModels, numpy arrays and plain containers straight to JSON.
+    Prefer this over json.dumps(convert_to_obj(data)), which builds an intermediate copy of the tree.
+    """
+    return orjson.dumps(data, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
 # ========================================================================================
 
-@dataclass
+@dataclass(slots=True)
 class IngestionHeuristics:
     min_files_to_consider_dir_for_problems: int
     min_file_content_len: int
 
 
-@dataclass
+# Internal-only ingestion records. These never cross a process boundary, so they are plain
+# dicts with a declared shape rather than validated models
+class RepoDirectory(TypedDict):
+    dirs: List[str]
+    files: List[str]
+    file_stats: Dict[str, Tuple[int, int]]  # file name -> (size, mtime_ns)
+
+
+class RepoFile(TypedDict):
+    path: str
+    contents: str
+    hash: str
+
+
+@dataclass(slots=True)
 class File:
     path: Path
     contents: str
 
-@dataclass
+@dataclass(slots=True)
 class EmbeddedFile:
     path: str
     contents: str
-    embedding: List
+    embedding: np.ndarray  # float16, shape (D,)
 
     def __str__(self):
         return f"File: {self.path}, Length: {len(self.contents)}"
@@ -84,20 +156,26 @@ class EmbeddedFile:
         return f"File: {self.path}, Length: {len(self.contents)}"
 
 
-@dataclass
+@dataclass(slots=True)
 class FilePair:
     cosine_similarity: float
     files: List[EmbeddedFile]
 
 
-@dataclass
+class CachedDirectory(TypedDict):
+    signature: str
+    hashes: List[str]  # content hash of every file embedded for the directory
+    pair: Optional[FilePair]
+
+
+@dataclass(slots=True)
 class ValidatorModelStats:
     input_tokens: int
     output_tokens: int
     cost: float
 
 
-@dataclass
+@dataclass(slots=True)
 class GeneratedProblemStatement:
     prompt: str
     model: str
@@ -107,17 +185,29 @@ class GeneratedProblemStatement:
     model_stats: Optional[ValidatorModelStats] = None
 
     def to_detailed_format(self) -> str:
-        context_files_string = ""
-        for i, file in enumerate(self.context_files):
-            context_files_string += f"# File {i} used to solve the problem: {file}"
-        return dedent(f"""
-        Problem Statement: {self.problem_statement}
-        Checklist of items to consider: {self.dynamic_checklist}
+        # Graders format the same problem once per match or submission, so memoize on its contents
+        return _detailed_format(
+            self.problem_statement, tuple(self.dynamic_checklist), tuple(self.context_files)
+        )
+
+
+@lru_cache(maxsize=256)
+def _detailed_format(
+    problem_statement: str,
+    dynamic_checklist: Tuple[str, ...],
+    context_files: Tuple[str, ...],
+) -> str:
+    context_files_string = ""
+    for i, file in enumerate(context_files):
+        context_files_string += f"# File {i} used to solve the problem: {file}"
+    return dedent(f"""
+        Problem Statement: {problem_statement}
+        Checklist of items to consider: {list(dynamic_checklist)}
         {context_files_string}
         """)
 
 
-@dataclass
+@dataclass(slots=True)
 class UnsolvedIssue:
     desc: str
     local_code_path: Path
@@ -125,6 +215,8 @@ class UnsolvedIssue:
 
 
 class MinerModelStats(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     api_calls: int
     instance_cost: float
     tokens_received: int
@@ -132,7 +224,7 @@ class MinerModelStats(BaseModel):
     total_cost: float
 
 
-@dataclass
+@dataclass(slots=True)
 class IssueSolution:
     patch: str
     model_stats: Optional[MinerModelStats] = None
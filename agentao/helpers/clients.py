@@ -1,20 +1,29 @@
+import atexit
 import logging
 import os
-from datetime import datetime
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, tzinfo
 from logging import Logger
+from typing import ClassVar
 
+import orjson
 import posthog
 import pytz
 from dotenv import load_dotenv
 
-load_dotenv()
+from agentao.helpers.classes import to_json_bytes
 
 
 class ESTFormatter(logging.Formatter):
+    EST: ClassVar[tzinfo] = pytz.timezone("America/New_York")
+    TIME_FORMAT: ClassVar[str] = "%Y-%m-%d %H:%M:%S"
+
     def formatTime(self, record, datefmt=None):
-        est = pytz.timezone("America/New_York")
-        ct = datetime.fromtimestamp(record.created, est)
-        return ct.strftime("%Y-%m-%d %H:%M:%S")
+        ct = datetime.fromtimestamp(record.created, self.EST)
+        return ct.strftime(self.TIME_FORMAT)
 
     def format(self, record):
         # Pad the level name to 5 characters
@@ -26,9 +35,22 @@ formatter = ESTFormatter('%(asctime)s - %(filename)s:%(lineno)d [%(levelname)s]
 
 
 class PostHogHandler(logging.Handler):
+    """
+    Forwards log records to PostHog. Records are queued by `emit` and sent in batches by a
+    background thread, so logging never blocks on PostHog's HTTP calls.
+    """
+    MAX_QUEUE_SIZE = 10_000
+    BATCH_SIZE = 64
+    DROP_WARNING_INTERVAL_S = 60.
+
     def __init__(self):
         super().__init__()
         self.setFormatter(formatter)
+        self._queue: queue.Queue = queue.Queue(maxsize=self.MAX_QUEUE_SIZE)
+        self._last_drop_warning = 0.
+        self._worker = threading.Thread(target=self._drain_forever, name="posthog-handler", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
 
     def emit(self, record):
         try:
@@ -40,18 +62,61 @@ class PostHogHandler(logging.Handler):
                 'description': description,
                 **properties
             }
-            posthog.capture(
-                distinct_id=distinct_id,
-                event=event_id,
-                properties=event_properties
-            )
+            self._queue.put_nowait((distinct_id, event_id, event_properties))
+        except queue.Full:
+            now = time.monotonic()
+            if now - self._last_drop_warning > self.DROP_WARNING_INTERVAL_S:
+                self._last_drop_warning = now
+                # Not logged, since this handler is attached to that logger and would be re-entered
+                print("PostHog queue is full, dropping log events", file=sys.stderr)
         except Exception:
             self.handleError(record)
 
+    def _send_batch(self, block: bool) -> int:
+        """Sends up to BATCH_SIZE queued events to PostHog, returning how many were sent."""
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block))
+            while len(batch) < self.BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        for distinct_id, event_id, event_properties in batch:
+            try:
+                posthog.capture(
+                    distinct_id=distinct_id,
+                    event=event_id,
+                    # Log properties may carry models, dataclasses or arrays, which the SDK's encoder rejects
+                    properties=orjson.loads(to_json_bytes(event_properties))
+                )
+            except Exception:
+                # A failed capture must not kill the worker thread
+                pass
+        return len(batch)
+
+    def _drain_forever(self) -> None:
+        while True:
+            self._send_batch(block=True)
+
+    def flush(self) -> None:
+        """Sends every queued event. Registered with atexit so nothing is lost on shutdown."""
+        while self._send_batch(block=False):
+            pass
+        posthog.flush()
+
 
 def setup_logger() -> Logger:
-    # Clear any existing handlers to avoid conflicts
     logger = logging.getLogger(__name__)
+
+    # The flag lives on the process-global logger rather than in this module, so that it
+    # survives importlib.reload and the handlers (and .env lookup) are only set up once
+    if getattr(logger, "agentao_initialized", False):
+        return logger
+
+    load_dotenv()
+
+    # Clear any existing handlers to avoid conflicts
     if logger.hasHandlers():
         logger.handlers.clear()
 
@@ -76,6 +141,7 @@ def setup_logger() -> Logger:
 
     # Attach the posthog_enabled flag to the logger
     logger.posthog_enabled = posthog_enabled
+    logger.agentao_initialized = True
     return logger
 
 
@@ -1,6 +1,8 @@
-from typing import List, Final, Dict
+import sys
+from types import MappingProxyType
+from typing import Final, Dict, Mapping, Tuple
 
-OPENAI_MODELS: Final[List[str]] = [
+OPENAI_MODELS: Final[Tuple[str, ...]] = (
     "gpt4",
     "gpt4-legacy",
     "gpt4-0125",
@@ -11,43 +13,35 @@ OPENAI_MODELS: Final[List[str]] = [
     "gpt4omini",
     "o1",
     "o1-mini",
-]
+)
 
-ANTHROPIC_MODELS: Final[List[str]] = [
+ANTHROPIC_MODELS: Final[Tuple[str, ...]] = (
     "claude-2",
     "claude-opus",
     "claude-sonnet",
     "claude-haiku",
     "claude-3-5-sonnet",
-]
-
-MODEL_NAME_TO_ENVAR_NAME: Final[Dict[str, str]] = (
-        {model: "OPENAI_API_KEY" for model in OPENAI_MODELS} |
-        {model: "ANTHROPIC_API_KEY" for model in ANTHROPIC_MODELS}
 )
 
-SUPPORTED_MINER_MODELS: Final[List[str]] = OPENAI_MODELS + ANTHROPIC_MODELS
+_model_name_to_envar_name: Dict[str, str] = dict.fromkeys(OPENAI_MODELS, "OPENAI_API_KEY")
+_model_name_to_envar_name.update(dict.fromkeys(ANTHROPIC_MODELS, "ANTHROPIC_API_KEY"))
+MODEL_NAME_TO_ENVAR_NAME: Final[Mapping[str, str]] = MappingProxyType(_model_name_to_envar_name)
+
+SUPPORTED_MINER_MODELS: Final[Tuple[str, ...]] = OPENAI_MODELS + ANTHROPIC_MODELS
 
 # TODO: Add support for other models on validator
-SUPPORTED_VALIDATOR_MODELS: Final[List[str]] = OPENAI_MODELS
+SUPPORTED_VALIDATOR_MODELS: Final[Tuple[str, ...]] = OPENAI_MODELS
 
 SENTINEL_FLOAT_FAILURE_VALUE: Final[float] = -1.
 SENTINEL_INT_FAILURE_VALUE: Final[int] = -1
 SENTINEL_STRING_FAILURE_VALUE: Final[str] = "N/A"
 
+# Prices of each canonical model; dated snapshots and shorthands resolve through MODEL_ALIASES
 PRICING_DATA_PER_MILLION_TOKENS: Final[Dict[str, Dict[str, float]]] = {
     "gpt-4o": {
         "input": 2.50,
         "output": 10.00,
     },
-    "gpt-4o-2024-11-20": {
-        "input": 2.50,
-        "output": 10.00,
-    },
-    "gpt-4o-2024-08-06": {
-        "input": 2.50,
-        "output": 10.00,
-    },
     "gpt-4o-audio-preview": {
         "text": {
             "input": 2.50,
@@ -58,16 +52,6 @@ PRICING_DATA_PER_MILLION_TOKENS: Final[Dict[str, Dict[str, float]]] = {
             "output": 200.00,
         }
     },
-    "gpt-4o-audio-preview-2024-10-01": {
-        "text": {
-            "input": 2.50,
-            "output": 10.00,
-        },
-        "audio": {
-            "input": 100.00,
-            "output": 200.00,
-        }
-    },
     "gpt-4o-2024-05-13": {
         "input": 5.00,
         "output": 15.00,
@@ -76,30 +60,14 @@ PRICING_DATA_PER_MILLION_TOKENS: Final[Dict[str, Dict[str, float]]] = {
         "input": 0.150,
         "output": 0.600,
     },
-    "gpt4omini": {
-        "input": 0.150,
-        "output": 0.600,
-    },
-    "gpt-4o-mini-2024-07-18": {
-        "input": 0.150,
-        "output": 0.600,
-    },
     "o1-preview": {
         "input": 15.00,
         "output": 60.00,
     },
-    "o1-preview-2024-09-12": {
-        "input": 15.00,
-        "output": 60.00,
-    },
     "o1-mini": {
         "input": 3.00,
         "output": 12.00,
     },
-    "o1-mini-2024-09-12": {
-        "input": 3.00,
-        "output": 12.00,
-    },
     "claude-3.5-sonnet": {
         "input": 3.00,
         "output": 15.00,
@@ -121,3 +89,31 @@ PRICING_DATA_PER_MILLION_TOKENS: Final[Dict[str, Dict[str, float]]] = {
         "output": 15.00,
     }
 }
+
+MODEL_ALIASES: Final[Mapping[str, str]] = MappingProxyType({
+    "gpt-4o-2024-11-20": "gpt-4o",
+    "gpt-4o-2024-08-06": "gpt-4o",
+    "gpt-4o-audio-preview-2024-10-01": "gpt-4o-audio-preview",
+    "gpt4omini": "gpt-4o-mini",
+    "gpt-4o-mini-2024-07-18": "gpt-4o-mini",
+    "o1-preview-2024-09-12": "o1-preview",
+    "o1-mini-2024-09-12": "o1-mini",
+})
+
+
+def _flatten_pricing(pricing_data: Mapping[str, Mapping]) -> Dict[Tuple[str, str, str], float]:
+    """Flattens the nested pricing table into (model, modality, "input" | "output") -> price."""
+    flat_pricing = {}
+    for model, prices in pricing_data.items():
+        model = sys.intern(model)
+        # Text-only models list their prices directly, multimodal ones per modality
+        prices_by_modality = {"text": prices} if "input" in prices else prices
+        for modality, modality_prices in prices_by_modality.items():
+            for direction, price in modality_prices.items():
+                flat_pricing[(model, modality, direction)] = price
+    return flat_pricing
+
+
+PRICING_PER_MILLION_TOKENS_FLAT: Final[Mapping[Tuple[str, str, str], float]] = MappingProxyType(
+    _flatten_pricing(PRICING_DATA_PER_MILLION_TOKENS)
+)
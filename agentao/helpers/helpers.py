@@ -1,17 +1,31 @@
+import fcntl
 import shutil
+import time
 from pathlib import Path
+from typing import Dict, Final
 
 import math
+import numpy as np
 from git import Repo
 
 from agentao.helpers.clients import LOGGER
-from agentao.helpers.constants import PRICING_DATA_PER_MILLION_TOKENS
+from agentao.helpers.constants import MODEL_ALIASES, PRICING_PER_MILLION_TOKENS_FLAT
+
+# Back-to-back requests for the same repository reuse the mirror without hitting GitHub again
+MIRROR_FETCH_INTERVAL_S: Final[float] = 300.
+
+_LAST_MIRROR_FETCH: Dict[Path, float] = {}
 
 
 def clone_repo(author_name: str, repo_name: str, base_path: Path) -> Path:
     """
     Clone a GitHub repository to a specified directory under 'repos' and return the path.
 
+    A bare mirror of the repository is kept under 'repos/.mirrors' and only fetched
+    incrementally, at most once every MIRROR_FETCH_INTERVAL_S per process. An existing
+    working copy is hard-reset to the mirror's HEAD and cleaned instead of being deleted
+    and re-cloned; it is only cloned from the local mirror when missing or unusable.
+
     :param author_name: GitHub username or organization name.
     :param repo_name: Repository name.
     :param base_path: Base path where the 'repos' directory will be created.
@@ -19,14 +33,36 @@ def clone_repo(author_name: str, repo_name: str, base_path: Path) -> Path:
     """
     try:
         repos_dir = base_path / "repos"
-        repos_dir.mkdir(parents=True, exist_ok=True)
+        mirrors_dir = repos_dir / ".mirrors"
+        mirrors_dir.mkdir(parents=True, exist_ok=True)
 
+        repo_url = f"https://github.com/{author_name}/{repo_name}.git"
+        mirror_path = mirrors_dir / f"{author_name}_{repo_name}.git"
         clone_to_path = repos_dir / repo_name
-        if clone_to_path.exists() and clone_to_path.is_dir():
-            shutil.rmtree(clone_to_path)
-            LOGGER.info(f"Directory {clone_to_path} has been removed.")
 
-        Repo.clone_from(f"https://github.com/{author_name}/{repo_name}.git", clone_to_path)
+        # Serialize access to the mirror and working copy across processes
+        with open(mirrors_dir / f"{author_name}_{repo_name}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if not mirror_path.exists():
+                Repo.clone_from(repo_url, mirror_path, mirror=True)
+                _LAST_MIRROR_FETCH[mirror_path] = time.monotonic()
+                LOGGER.info(f"Repository mirrored to {mirror_path}")
+            elif time.monotonic() - _LAST_MIRROR_FETCH.get(mirror_path, -math.inf) >= MIRROR_FETCH_INTERVAL_S:
+                Repo(mirror_path).remotes.origin.fetch(prune=True)
+                _LAST_MIRROR_FETCH[mirror_path] = time.monotonic()
+                LOGGER.info(f"Fetched latest changes into mirror {mirror_path}")
+
+            if _reset_working_copy(clone_to_path, mirror_path):
+                LOGGER.info(f"Reset existing working copy at {clone_to_path}")
+            else:
+                if clone_to_path.exists() and clone_to_path.is_dir():
+                    shutil.rmtree(clone_to_path)
+                    LOGGER.info(f"Directory {clone_to_path} has been removed.")
+
+                repo = Repo.clone_from(str(mirror_path), clone_to_path, shared=True)
+                repo.remotes.origin.set_url(repo_url)
+
         LOGGER.info(f"Repository cloned to {clone_to_path}")
         return clone_to_path
     except Exception:
@@ -34,9 +70,26 @@ def clone_repo(author_name: str, repo_name: str, base_path: Path) -> Path:
         raise
 
 
-def calculate_price(model_name: str, input_tokens: int, output_tokens: int) -> float:
-    pricing_dict = PRICING_DATA_PER_MILLION_TOKENS[model_name]
-    input_price, output_price = pricing_dict["input"], pricing_dict["output"]
+def _reset_working_copy(clone_to_path: Path, mirror_path: Path) -> bool:
+    """Bring an existing working copy up to the mirror's HEAD, discarding local changes"""
+    if not (clone_to_path / ".git").is_dir():
+        return False
+
+    try:
+        repo = Repo(clone_to_path)
+        repo.git.fetch(str(mirror_path), "HEAD")
+        repo.git.reset("--hard", "FETCH_HEAD")
+        repo.git.clean("-fdx")
+        return True
+    except Exception:
+        LOGGER.warning(f"Could not reuse working copy at {clone_to_path}, re-cloning")
+        return False
+
+
+def calculate_price(model_name: str, input_tokens: int, output_tokens: int, modality: str = "text") -> float:
+    model_name = MODEL_ALIASES.get(model_name, model_name)
+    input_price = PRICING_PER_MILLION_TOKENS_FLAT[(model_name, modality, "input")]
+    output_price = PRICING_PER_MILLION_TOKENS_FLAT[(model_name, modality, "output")]
     return (input_tokens * input_price + output_tokens * output_price) / 1e6
 
 
@@ -54,3 +107,21 @@ def exponential_decay(N, x):
     if x >= N:
         return 0
     return math.exp(-x / (N - x))
+
+
+def exponential_decay_batch(N, xs: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of `exponential_decay`, applied element-wise to `xs`.
+
+    Parameters:
+    - N (int or float): The threshold value.
+    - xs (np.ndarray): The input values.
+
+    Returns:
+    - np.ndarray: The output values, 0 wherever x >= N.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    out = np.zeros_like(xs)
+    mask = xs < N
+    out[mask] = np.exp(-xs[mask] / (N - xs[mask]))
+    return out
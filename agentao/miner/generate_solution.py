@@ -2,26 +2,41 @@ from __future__ import annotations
 
 import time
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from pprint import pformat
-from typing import List
+from typing import TYPE_CHECKING, Final, List, Tuple
 
 from simple_parsing.helpers.flatten import FlattenedAccess
 from simple_parsing.helpers.serialization.serializable import FrozenSerializable
-import sweagent
-from sweagent.agent.agents import Agent
-from sweagent.agent.agents import AgentArguments
-from sweagent.agent.models import ModelArguments
-from sweagent.environment.swe_env import EnvironmentArguments
-from sweagent.environment.swe_env import SWEEnv
-from sweagent.environment.utils import (
-    get_data_path_name,
-)
-from sweagent.types import AgentInfo, TrajectoryStep
-
-from agentao.helpers.classes import UnsolvedIssue, IssueSolution, MinerModelStats
+
+from agentao.helpers.classes import UnsolvedIssue, IssueSolution, MinerModelStats, to_json_bytes
 from agentao.helpers.clients import LOGGER
 
+# SWE-agent pulls in heavy model/provider dependencies, so it is only imported where it is
+# actually used, keeping this module cheap to import for its dataclasses alone
+if TYPE_CHECKING:
+    from sweagent.agent.agents import AgentArguments
+    from sweagent.environment.swe_env import EnvironmentArguments
+    from sweagent.types import AgentInfo, TrajectoryStep
+
+
+# Fields of the SWE-agent info dict worth logging; the rest (e.g. edited file contents) can be huge
+_LOGGED_INFO_KEYS: Final[Tuple[str, ...]] = ("exit_status", "model_stats")
+
+# SWE-agent tags the task images it caches (`cache_task_images`) with this prefix
+CACHED_TASK_IMAGE_PREFIX: Final[str] = "swe-agent-task-env-"
+# Each new (repo, commit, setup) adds a cached image of a few GB, so only the newest are kept
+MAX_CACHED_TASK_IMAGES: Final[int] = 8
+
+
+@lru_cache(maxsize=1)
+def _default_config_file() -> Path:
+    import sweagent
+
+    swe_agent_root = Path(sweagent.__file__).parent.parent
+    return swe_agent_root / "config/default_from_url.yaml"
+
 
 @dataclass(frozen=True)
 class ActionsArguments(FlattenedAccess, FrozenSerializable):
@@ -67,6 +82,8 @@ class ScriptArguments(FlattenedAccess, FrozenSerializable):
     @property
     def run_name(self) -> str:
         """Generate a unique name for this run based on the arguments."""
+        from sweagent.environment.utils import get_data_path_name
+
         model_name = self.agent.model.model_name.replace(":", "-")
         data_stem = get_data_path_name(self.environment.data_path)
         assert self.agent.config_file is not None  # mypy
@@ -89,7 +106,10 @@ def create_script_arguments(
         unsolved_issue: UnsolvedIssue,
         instance_cost_limit: float
 ) -> ScriptArguments:
-    swe_agent_root = Path(sweagent.__file__).parent.parent
+    from sweagent.agent.agents import AgentArguments
+    from sweagent.agent.models import ModelArguments
+    from sweagent.environment.swe_env import EnvironmentArguments
+
     return ScriptArguments(
         environment=EnvironmentArguments(
             image_name="sweagent/swe-agent:latest",
@@ -97,6 +117,9 @@ def create_script_arguments(
             repo_path=str(unsolved_issue.local_code_path),
             verbose=True,
             install_environment=True,
+            # Snapshot the container after environment setup as an image per (repo, commit, setup), so
+            # later requests for the same repo start from it instead of reinstalling everything
+            cache_task_images=True,
             environment_setup=str(unsolved_issue.env_setup_path)
         ),
         skip_existing=False,
@@ -105,7 +128,7 @@ def create_script_arguments(
                 model_name= model_name,
                 per_instance_cost_limit=instance_cost_limit,
             ),
-            config_file=Path(swe_agent_root / "config/default_from_url.yaml"),
+            config_file=_default_config_file(),
         ),
         actions=ActionsArguments(
             open_pr=False,
@@ -115,9 +138,35 @@ def create_script_arguments(
         print_config=True,
     )
 
+def evict_cached_task_images(max_images: int = MAX_CACHED_TASK_IMAGES) -> None:
+    """
+    Removes all but the `max_images` most recently created cached task images. Images a container
+    still uses are refused by docker and left in place.
+    """
+    import docker
+
+    client = docker.from_env()
+    try:
+        cached_images = [
+            image for image in client.images.list()
+            if any(tag.startswith(CACHED_TASK_IMAGE_PREFIX) for tag in image.tags)
+        ]
+        cached_images.sort(key=lambda image: image.attrs["Created"], reverse=True)
+        for image in cached_images[max_images:]:
+            LOGGER.info("Evicting cached task image %s", image.tags[0])
+            try:
+                client.images.remove(image.id)
+            except docker.errors.APIError:
+                LOGGER.warning("Failed to evict cached task image %s", image.tags[0], exc_info=True)
+    finally:
+        client.close()
+
 def generate_code_patch(
         model_name: str, unsolved_issue: UnsolvedIssue, instance_cost_limit: float
 ) -> IssueSolution:
+    from sweagent.agent.agents import Agent
+    from sweagent.environment.swe_env import SWEEnv
+
     script_arguments = create_script_arguments(model_name, unsolved_issue, instance_cost_limit)
 
     env = SWEEnv(script_arguments.environment)
@@ -133,23 +182,34 @@ def generate_code_patch(
     trajectory_steps: List[TrajectoryStep]
 
     start_time = time.time()
-    info, trajectory_steps = agent.run(
-        setup_args={"issue": getattr(env, "query", None), "files": [], "test_files": [], "tests": []},
-        env=env,
-        observation=observation,
-        traj_dir=trajectories_dir,
-        return_type="info_trajectory",
-    )
+    try:
+        info, trajectory_steps = agent.run(
+            setup_args={"issue": getattr(env, "query", None), "files": [], "test_files": [], "tests": []},
+            env=env,
+            observation=observation,
+            traj_dir=trajectories_dir,
+            return_type="info_trajectory",
+        )
+    finally:
+        # Containers are not reused across requests, so don't leave one running per request
+        env.close()
     duration_s = time.time() - start_time
 
+    try:
+        evict_cached_task_images()
+    except Exception:
+        LOGGER.warning("Failed to evict cached task images", exc_info=True)
+
     if info.get("submission") is None:
         raise ValueError(f"SWE-agent failed to submit. Ran for {duration_s:.2f}s. Info: {pformat(info)}")
 
-    readable_info = {
-        k: (v if k not in ["edited_files30", "submission", "edited_files50"] else f"{v[:100]}...")
-        for k, v in info.items()
-    }
-    LOGGER.info(f"Finished running sweagent, ran for {duration_s:.2f}s. Received info: {pformat(readable_info)}")
+    log_payload = {key: info.get(key) for key in _LOGGED_INFO_KEYS}
+    log_payload["submission_truncated"] = f"{info['submission'][:100]}..."
+    LOGGER.info(
+        "Finished running sweagent, ran for %.2fs. Received info: %s",
+        duration_s,
+        to_json_bytes(log_payload).decode(),
+    )
     return IssueSolution(
         patch=info["submission"],
         model_stats=MinerModelStats.model_validate(
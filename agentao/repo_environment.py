@@ -1,10 +1,12 @@
 from typing import Dict, Final, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from swebench.harness.constants import MAP_REPO_VERSION_TO_SPECS
 
 
 class RepoEnvironmentInfo(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     install_command: str
     python_version: str
 
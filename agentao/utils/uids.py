@@ -26,6 +26,25 @@ def check_uid_availability(
     return True
 
 
+def get_available_uids(
+    metagraph: "bt.metagraph.Metagraph", vpermit_tao_limit: int
+) -> np.ndarray:
+    """Vectorized version of `check_uid_availability` over every uid in the metagraph
+    Args:
+        metagraph (:obj: bt.metagraph.Metagraph): Metagraph object
+        vpermit_tao_limit (int): Validator permit tao limit
+    Returns:
+        uids (np.ndarray): Available uids, in ascending order.
+    """
+    is_serving = np.fromiter(
+        (axon.is_serving for axon in metagraph.axons), dtype=bool, count=len(metagraph.axons)
+    )
+    over_permit_limit = np.asarray(metagraph.validator_permit, dtype=bool) & (
+        np.asarray(metagraph.S) > vpermit_tao_limit
+    )
+    return np.flatnonzero(is_serving & ~over_permit_limit)
+
+
 def get_random_uids(
     self, k: int, exclude: List[int] = None
 ) -> np.ndarray:
@@ -1,20 +1,30 @@
 import os
 from dataclasses import dataclass
+from operator import attrgetter
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Final, Union, Callable
+from types import MappingProxyType
+from typing import List, Final, Union, Callable, Mapping
 
 import openai
-from jinja2 import Template
-from pydantic import BaseModel
+from jinja2 import Environment, StrictUndefined, Template
+from pydantic import BaseModel, ConfigDict
 
 from agentao.helpers.classes import FilePair, GeneratedProblemStatement, \
     ValidatorModelStats, IngestionHeuristics
 from agentao.helpers.helpers import calculate_price
 from agentao.validator.ingest import get_all_filepairs
 
-PROBLEM_STATEMENT_TEMPLATE: Final[Template] = Template(
-    dedent("""
+# Templates are compiled once against this environment and reused for every render
+_JINJA_ENV: Final[Environment] = Environment(
+    autoescape=False,
+    cache_size=400,
+    auto_reload=False,
+    optimized=True,
+    undefined=StrictUndefined,
+)
+
+_PROBLEM_STATEMENT_SOURCE: Final[str] = dedent("""
     You are a skilled software engineering assistant. You will be provided with multiple files as context. Each file will contain portions of code, documentation, or relevant information about a software system. Your task is to come up with a specific software engineering problem that requires a solution to involve at least two of these files. You will generate a list of these problems, in the generated_problems array response.
 
     Further, once you have a problem statement, generate a checklist of points to consider and things that should be present in the solution (for example, are the correct Github API calls made if its a function that interfaces with the api). Generate several of these into dynamic_checklist field.
@@ -34,12 +44,21 @@ PROBLEM_STATEMENT_TEMPLATE: Final[Template] = Template(
     {% endfor %}
     ```
     """)
-)
+
+PROBLEM_STATEMENT_TEMPLATE: Final[Template] = _JINJA_ENV.from_string(_PROBLEM_STATEMENT_SOURCE)
+
+# Maps the shorthand model names accepted on the CLI to OpenAI model ids
+_MODEL_ALIASES: Final[Mapping[str, str]] = MappingProxyType({
+    "gpt4omini": "gpt-4o-mini",
+    "gpt4o": "gpt-4o",
+})
 
 # TODO: Add support for other model providers
 OPENAI_CLIENT: Final[openai.Client] = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
 
 class GeneratedProblem(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     problem_statement: str
     dynamic_checklist: List[str]
 
@@ -53,17 +72,13 @@ class ProblemGeneratorParameters:
 
 # We use pydantic for some classes because OpenAI json output can structure based on that
 class ListOfGeneratedProblems(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     generated_problem_statements: List[GeneratedProblem]
 
 
 def highest_cosine_filepair_selector(file_pairs: List[FilePair]) -> FilePair:
-    selected_file_pair = sorted(
-        file_pairs,
-        key=lambda x: float(x.cosine_similarity),
-        reverse=True
-    )[0]
-
-    return selected_file_pair
+    return max(file_pairs, key=attrgetter("cosine_similarity"))
 
 
 def create_problem_statements(
@@ -125,13 +140,7 @@ def generate_problem_statements(
         )
     )
 
-    model_map = {
-        "gpt4omini": "gpt-4o-mini",
-        "gpt4o": "gpt-4o"
-    }
-    model = parameters.problem_gen_model if parameters.problem_gen_model not in model_map \
-        else model_map[parameters.problem_gen_model]
-
+    model = _MODEL_ALIASES.get(parameters.problem_gen_model, parameters.problem_gen_model)
 
     completion = OPENAI_CLIENT.beta.chat.completions.parse(
         model=model,
@@ -1,12 +1,12 @@
 from abc import ABC
+from dataclasses import dataclass
 from typing import List
 
-from pydantic import BaseModel
-
 from agentao.helpers.classes import GeneratedProblemStatement, IssueSolution
 
 
-class MinerSubmission(BaseModel):
+@dataclass(slots=True)
+class MinerSubmission:
     repo: str
     problem: GeneratedProblemStatement
     solution: IssueSolution
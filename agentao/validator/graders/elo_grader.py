@@ -1,23 +1,45 @@
+import asyncio
 import os
 import random
+import tempfile
+import time
 from dataclasses import dataclass
 from itertools import combinations
 from textwrap import dedent
 from typing import List
-from typing import Tuple, Dict, Final
+from typing import Tuple, Dict, Final, Optional
 
 import openai
-from pydantic import BaseModel
+import orjson
+from pydantic import BaseModel, ConfigDict
+from tenacity import retry, stop_after_attempt, wait_exponential
 
 from agentao.helpers.classes import GeneratedProblemStatement
 from agentao.helpers.clients import LOGGER
 from agentao.validator.graders.abstract_grader import GraderInterface, MinerSubmission
+from agentao.validator.graders.helpers import new_async_openai_client, run_coroutine_sync
+from agentao.validator.graders.judge_cache import get_cached, make_key, set_cached
 
 NUM_ELO_ROUNDS: Final[int] = 2
+MAX_CONCURRENT_JUDGE_CALLS: Final[int] = 10
+JUDGE_MODEL: Final[str] = "gpt-4o"
+BATCH_POLL_INTERVAL_S: Final[float] = 60.
 
 class EloGrader(GraderInterface):
+    def __init__(self, batch: bool = False, seed: Optional[int] = None):
+        """
+        Args:
+            batch (bool): Judge matches through the OpenAI Batch API instead of real-time calls.
+                Half the cost, but results can take up to 24h, so only for offline grading runs
+            seed (int): Seed for the match order, to make runs reproducible
+        """
+        self.batch = batch
+        self.seed = seed
+
     def grade(self, submissions: List[MinerSubmission]) -> List[float]:
-        scores = rank_elo(submissions)
+        if self.batch:
+            return rank_elo_batch(submissions, self.seed)
+        scores = rank_elo(submissions, self.seed)
         return scores
 
 
@@ -93,11 +115,14 @@ class EloRating:
 
 
 class WinLoss(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     model_1_victor: bool
     model_2_victor: bool
     is_draw: bool
     explanation: str
 
+
 @dataclass
 class SolvedProblem:
     problem: GeneratedProblemStatement
@@ -107,30 +132,21 @@ class SolvedProblem:
     solution: str
 
 
-def generate_matches(indices: List[str]) -> List[Tuple[str, str]]:
-    """Run a tournament comparing all solutions multiple times."""
-    matches: List[Tuple[str, str]] = []
-    solution_pairs: List[Tuple[str, str]] = list(combinations(indices, 2))
-
-    # Run multiple rounds
-    for _ in range(NUM_ELO_ROUNDS):
-        random.shuffle(solution_pairs)  # Randomize match order
-        for sol_a, sol_b in solution_pairs:
-            matches.append((sol_a, sol_b))
+def generate_matches(indices: List[str], seed: Optional[int] = None) -> List[Tuple[str, str]]:
+    """
+    Run a tournament comparing all solutions multiple times. Every pair plays once per round,
+    and all rounds are shuffled together in a single pass.
 
+    Args:
+        seed (int): Seed for the match order, to make runs reproducible
+    """
+    matches: List[Tuple[str, str]] = list(combinations(indices, 2)) * NUM_ELO_ROUNDS
+    random.Random(seed).shuffle(matches)
     return matches
 
 
-def generate_win_loss_for_problem(
-    local_elo: EloRating,
-    problem: GeneratedProblemStatement,
-    solution_0_and_index_str: Tuple[MinerSubmission, str],
-    solution_1_and_index_str: Tuple[MinerSubmission, str],
-    openai_client: openai.Client,
-) -> None:
-    solution_0, solution_0_index_str = solution_0_and_index_str
-    solution_1, solution_1_index_str = solution_1_and_index_str
-    prompt = dedent(f"""
+def _judge_system_prompt(problem_text: str) -> str:
+    return dedent(f"""
     You are an unbiased code evaluator, who takes in a problem statement, plus a checklist of factors that a solution to the statement should consider.
     For context, you will also be given the files used to generate a solution.
     Then, you will be given two solutions, Determine which solution is better.
@@ -138,26 +154,25 @@ def generate_win_loss_for_problem(
     Otherwise, return is_draw = False and victor_model = the model id of the better solution.
     There is one ground truth solution, though it may not be one the solutions provided. The goal is to evenutally find this coherent solution (that works and was merged). The winner should generally reflect which model is more likely to be this ground truth real world winner.
     ------
-    {problem.to_detailed_format()}
+    {problem_text}
     ------
     """)
 
-    context = dedent(f"""
-    Model 1 solution: {solution_0.solution}
-    Model 2 solution: {solution_1.solution}
-    """)
 
-    completion = openai_client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": context},
-        ],
-        response_format=WinLoss,
-    )
+def build_judge_messages(
+    system_prompt: str,
+    solution_0: MinerSubmission,
+    solution_1: MinerSubmission,
+) -> List[Dict[str, str]]:
+    context = f"\nModel 1 solution: {solution_0.solution}\nModel 2 solution: {solution_1.solution}\n"
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": context},
+    ]
 
-    output = completion.choices[0].message.parsed
 
+def validate_win_loss(output: WinLoss) -> WinLoss:
     outputs = [output.model_1_victor, output.model_2_victor, output.is_draw]
 
     if sum(outputs) < 1:
@@ -170,10 +185,114 @@ def generate_win_loss_for_problem(
             f"Invalid output: {output}. More than 1 value is true from (1, 2, draw). Received: {outputs}"
         )
 
+    return output
+
+
+def _resolve_trivially(patch_0: str, patch_1: str) -> WinLoss | None:
+    """
+    Decide matches that need no judging: an empty patch loses to a non-empty one, and patches
+    that only differ in whitespace draw.
+    """
+    normalized_0, normalized_1 = "".join(patch_0.split()), "".join(patch_1.split())
+
+    # Built from trusted literals, so validation is skipped
+    if normalized_0 == normalized_1:
+        return WinLoss.model_construct(model_1_victor=False, model_2_victor=False, is_draw=True, explanation="Same patch")
+    if not normalized_1:
+        return WinLoss.model_construct(model_1_victor=True, model_2_victor=False, is_draw=False, explanation="Model 2 patch is empty")
+    if not normalized_0:
+        return WinLoss.model_construct(model_1_victor=False, model_2_victor=True, is_draw=False, explanation="Model 1 patch is empty")
+
+    return None
+
+
+async def _get_cached_win_loss(problem_text: str, patch_0: str, patch_1: str) -> WinLoss | None:
+    cached = await get_cached(make_key(problem_text, patch_0, patch_1))
+    if cached is not None:
+        return WinLoss.model_validate_json(cached)
+
+    # A verdict for the swapped pair answers this one too, with the victors flipped
+    swapped = await get_cached(make_key(problem_text, patch_1, patch_0))
+    if swapped is not None:
+        output = WinLoss.model_validate_json(swapped)
+        return output.model_copy(update={
+            "model_1_victor": output.model_2_victor,
+            "model_2_victor": output.model_1_victor,
+        })
+
+    return None
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+async def _judge_uncached_pair(
+    system_prompt: str,
+    solution_0: MinerSubmission,
+    solution_1: MinerSubmission,
+    openai_client: openai.AsyncClient,
+    semaphore: asyncio.Semaphore,
+) -> WinLoss:
+    async with semaphore:
+        completion = await openai_client.beta.chat.completions.parse(
+            model=JUDGE_MODEL,
+            messages=build_judge_messages(system_prompt, solution_0, solution_1),
+            response_format=WinLoss,
+        )
+
+    output = completion.choices[0].message.parsed
+    if output is None:
+        raise Exception("OpenAI did not judge the matchup")
+
+    return validate_win_loss(output)
+
+
+async def judge_pairs(
+    problem_text: str,
+    system_prompt: str,
+    pairs: List[Tuple[MinerSubmission, MinerSubmission]],
+    openai_client: openai.AsyncClient,
+    semaphore: asyncio.Semaphore,
+) -> List[WinLoss]:
+    """
+    Ask the judge model which solution of each pair is better. Each pair not already cached gets
+    its own request, so one miner's patch can never influence the verdict of another matchup.
+    Does not touch any Elo state.
+    """
+    outputs: List[WinLoss | None] = [
+        _resolve_trivially(solution_0.solution.patch, solution_1.solution.patch)
+        for solution_0, solution_1 in pairs
+    ]
+    num_trivial = sum(output is not None for output in outputs)
+    if num_trivial:
+        LOGGER.info(f"Resolved {num_trivial}/{len(pairs)} matches without the judge model")
+
+    for i, (solution_0, solution_1) in enumerate(pairs):
+        if outputs[i] is None:
+            outputs[i] = await _get_cached_win_loss(problem_text, solution_0.solution.patch, solution_1.solution.patch)
+
+    uncached = [i for i, output in enumerate(outputs) if output is None]
+    results = await asyncio.gather(*[
+        _judge_uncached_pair(system_prompt, *pairs[i], openai_client, semaphore) for i in uncached
+    ])
+    for i, output in zip(uncached, results):
+        solution_0, solution_1 = pairs[i]
+        await set_cached(
+            make_key(problem_text, solution_0.solution.patch, solution_1.solution.patch),
+            output.model_dump_json(),
+        )
+        outputs[i] = output
+
+    return outputs
+
+
+def apply_win_loss(
+    local_elo: EloRating,
+    output: WinLoss,
+    solution_0_index_str: str,
+    solution_1_index_str: str,
+) -> None:
     if output.is_draw:
         local_elo.update_ratings(solution_0_index_str, solution_1_index_str, 0.5)
-
-    if output.model_1_victor:
+    elif output.model_1_victor:
         local_elo.update_ratings(solution_0_index_str, solution_1_index_str, 1.0)
     else:
         local_elo.update_ratings(solution_1_index_str, solution_0_index_str, 1.0)
@@ -185,24 +304,46 @@ def get_raw_elo_rankings(elox: EloRating, indices: List[str]) -> Dict[str, float
     return dict(sorted(rankings.items(), key=lambda x: x[1], reverse=True))
 
 
-def rank_elo(submissions: List[MinerSubmission]) -> List[float]:
-    openai_client: Final[openai.Client] = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
+def rank_elo(submissions: List[MinerSubmission], seed: Optional[int] = None) -> List[float]:
+    return run_coroutine_sync(rank_elo_async(submissions, seed))
+
+
+async def rank_elo_async(submissions: List[MinerSubmission], seed: Optional[int] = None) -> List[float]:
+    async with new_async_openai_client() as openai_client:
+        return await _rank_elo_with_client(submissions, openai_client, seed)
+
+
+async def _rank_elo_with_client(
+    submissions: List[MinerSubmission],
+    openai_client: openai.AsyncClient,
+    seed: Optional[int] = None,
+) -> List[float]:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_JUDGE_CALLS)
 
     local_elo = EloRating()
     problem: GeneratedProblemStatement = submissions[0].problem
+    # Every match shares the problem, so its prompt is only built once
+    problem_text = problem.to_detailed_format()
+    system_prompt = _judge_system_prompt(problem_text)
     str_indices: List[str] = [str(i) for i in range(len(submissions))]
 
-    for first, second in generate_matches(str_indices):
-        solution_0: MinerSubmission = submissions[int(first)]
-        solution_1: MinerSubmission = submissions[int(second)]
+    matches = generate_matches(str_indices, seed)
+
+    # Repeat matches of a pair get the same verdict, so each distinct pair is judged once. Judging
+    # is independent across pairs, so all of them are judged concurrently
+    unique_pairs = list(dict.fromkeys(matches))
+    pair_outputs = await judge_pairs(
+        problem_text,
+        system_prompt,
+        [(submissions[int(first)], submissions[int(second)]) for first, second in unique_pairs],
+        openai_client,
+        semaphore,
+    )
+    outputs: Dict[Tuple[str, str], WinLoss] = dict(zip(unique_pairs, pair_outputs))
 
-        generate_win_loss_for_problem(
-            local_elo,
-            problem,
-            solution_0_and_index_str=(solution_0, first),
-            solution_1_and_index_str=(solution_1, second),
-            openai_client=openai_client,
-        )
+    # Elo updates depend on order, so they are applied afterwards in the shuffled match order
+    for first, second in matches:
+        apply_win_loss(local_elo, outputs[(first, second)], first, second)
         LOGGER.info(f"Current rankings: {get_raw_elo_rankings(local_elo, str_indices)}")
 
     raw_elo_model_rankings = get_raw_elo_rankings(local_elo, str_indices)
@@ -210,3 +351,81 @@ def rank_elo(submissions: List[MinerSubmission]) -> List[float]:
 
     scores = [raw_elo_model_rankings[str(i)] for i in range(len(submissions))]
     return scores
+
+
+def rank_elo_batch(submissions: List[MinerSubmission], seed: Optional[int] = None) -> List[float]:
+    """
+    Same tournament as `rank_elo`, but every match is judged in a single OpenAI Batch API job.
+    The decisions are then replayed through the Elo ratings in the original match order.
+    """
+    # Built here rather than at import, so importing the graders needs no API key
+    openai_client = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
+
+    local_elo = EloRating()
+    problem: GeneratedProblemStatement = submissions[0].problem
+    # Every match shares the problem, so its prompt is only built once
+    problem_text = problem.to_detailed_format()
+    system_prompt = _judge_system_prompt(problem_text)
+    str_indices: List[str] = [str(i) for i in range(len(submissions))]
+    matches = generate_matches(str_indices, seed)
+    # Repeat matches of a pair get the same verdict, so each distinct pair is only judged once
+    unique_pairs = list(dict.fromkeys(matches))
+
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {"name": WinLoss.__name__, "schema": WinLoss.model_json_schema()},
+    }
+    with tempfile.NamedTemporaryFile(mode="wb", suffix=".jsonl", delete=False) as batch_file:
+        for first, second in unique_pairs:
+            batch_file.write(orjson.dumps({
+                "custom_id": f"{first}_{second}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": JUDGE_MODEL,
+                    "messages": build_judge_messages(system_prompt, submissions[int(first)], submissions[int(second)]),
+                    "response_format": response_format,
+                },
+            }) + b"\n")
+
+    try:
+        with open(batch_file.name, "rb") as f:
+            input_file = openai_client.files.create(file=f, purpose="batch")
+    finally:
+        os.remove(batch_file.name)
+
+    batch = openai_client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    LOGGER.info(f"Submitted batch {batch.id} with {len(unique_pairs)} Elo pairs")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_INTERVAL_S)
+        batch = openai_client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or batch.output_file_id is None:
+        raise RuntimeError(f"Batch {batch.id} did not complete, status: {batch.status}")
+
+    outputs: Dict[str, WinLoss] = {}
+    for line in openai_client.files.content(batch.output_file_id).text.splitlines():
+        result = orjson.loads(line)
+        try:
+            content = result["response"]["body"]["choices"][0]["message"]["content"]
+            outputs[result["custom_id"]] = validate_win_loss(WinLoss.model_validate_json(content))
+        except Exception:
+            LOGGER.exception(f"Invalid judge output for match {result.get('custom_id')}, skipping it")
+
+    for first, second in matches:
+        output = outputs.get(f"{first}_{second}")
+        if output is None:
+            LOGGER.warning(f"No judge output for match {first} vs {second}, skipping it")
+            continue
+        apply_win_loss(local_elo, output, first, second)
+
+    raw_elo_model_rankings = get_raw_elo_rankings(local_elo, str_indices)
+    LOGGER.info(f"Raw elo model rankings: {raw_elo_model_rankings}")
+
+    scores = [raw_elo_model_rankings[str(i)] for i in range(len(submissions))]
+    return scores
@@ -1,15 +1,19 @@
-import os
+import asyncio
 from statistics import mean
 from textwrap import dedent
 from typing import Final, List
 
 import openai
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from tenacity import retry, stop_after_attempt, wait_exponential
 
 from agentao.helpers.classes import GeneratedProblemStatement, IssueSolution, ValidatorModelStats
 from agentao.helpers.clients import LOGGER
 from agentao.validator.graders.abstract_grader import MinerSubmission, GraderInterface
-from agentao.validator.graders.helpers import preprocess_patch
+from agentao.validator.graders.helpers import new_async_openai_client, preprocess_patch, run_coroutine_sync
+from agentao.validator.graders.judge_cache import get_cached, make_key, set_cached
+
+MAX_CONCURRENT_GRADING_CALLS: Final[int] = 10
 
 GRADER_SYSTEM_PROMPT: Final[str] = """
 Instructions:
@@ -40,6 +44,8 @@ Affected Files:
 """
 
 class FloatGraderScore(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     dynamic_checklist_scores: List[float]
     addresses_problem_in_statement: float
     logical_solution: float
@@ -58,13 +64,71 @@ EMPTY_PATCH_SCORE: Final[FloatGraderScore] = FloatGraderScore(
 
 class FloatGrader(GraderInterface):
     def grade(self, submissions: List[MinerSubmission]) -> List[float]:
-        overall_scores = []
+        return run_coroutine_sync(grade_async(submissions))
+
+
+async def grade_async(submissions: List[MinerSubmission]) -> List[float]:
+    async with new_async_openai_client() as openai_client:
+        return await _grade_with_client(submissions, openai_client)
+
+
+async def _grade_with_client(
+    submissions: List[MinerSubmission],
+    openai_client: openai.AsyncClient,
+) -> List[float]:
+    # Miners often submit identical patches, so each distinct (repo, problem, patch) is only graded once
+    cache_keys = [_cache_key(submission) for submission in submissions]
+    first_index_by_key = {}
+    for i, key in enumerate(cache_keys):
+        first_index_by_key.setdefault(key, i)
+
+    unique_scores = await _grade_unique_with_client(
+        [submissions[i] for i in first_index_by_key.values()], openai_client
+    )
+    score_by_key = dict(zip(first_index_by_key, unique_scores))
+    return [score_by_key[key] for key in cache_keys]
+
+
+async def _grade_unique_with_client(
+    submissions: List[MinerSubmission],
+    openai_client: openai.AsyncClient,
+) -> List[float]:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GRADING_CALLS)
 
-        for submission in submissions:
-            miner_output_score = _grade_miner_solution(submission)
-            overall_scores.append(_compute_overall_score(miner_output_score))
+    # Each entry ends up as a score, or the exception that stopped the submission being graded
+    miner_output_scores = await asyncio.gather(*[
+        _preprocess_miner_solution(submission) for submission in submissions
+    ], return_exceptions=True)
 
-        return overall_scores
+    # Each patch is graded in its own request so one miner's patch can never influence another's score
+    pending = [i for i, prepared in enumerate(miner_output_scores) if isinstance(prepared, str)]
+    graded_scores = await asyncio.gather(*[
+        _grade_miner_solution(
+            submissions[i].problem,
+            miner_output_scores[i],
+            openai_client,
+            semaphore,
+        )
+        for i in pending
+    ], return_exceptions=True)
+
+    for i, score in zip(pending, graded_scores):
+        miner_output_scores[i] = score
+        if not isinstance(score, BaseException):
+            await set_cached(_cache_key(submissions[i]), score.model_dump_json())
+
+    overall_scores = []
+    for submission, miner_output_score in zip(submissions, miner_output_scores):
+        if isinstance(miner_output_score, BaseException):
+            LOGGER.error(
+                f"Failed to grade submission from {submission.miner_hotkey}, scoring it 0",
+                exc_info=miner_output_score,
+            )
+            overall_scores.append(0.)
+            continue
+        overall_scores.append(_compute_overall_score(miner_output_score))
+
+    return overall_scores
 
 
 def _compute_overall_score(miner_output_score: FloatGraderScore) -> float:
@@ -90,35 +154,61 @@ def _compute_overall_score(miner_output_score: FloatGraderScore) -> float:
     )
 
 
-def _grade_miner_solution(miner_submission: MinerSubmission) -> FloatGraderScore:
-    repo = miner_submission.repo
-    generated_problem_statement = miner_submission.problem
-    miner_solution = miner_submission.solution
+def _cache_key(miner_submission: MinerSubmission) -> str:
+    return make_key(
+        miner_submission.repo,
+        miner_submission.problem.to_detailed_format(),
+        miner_submission.solution.patch,
+    )
+
+
+async def _preprocess_miner_solution(miner_submission: MinerSubmission) -> FloatGraderScore | str:
+    """
+    Returns the final score if no grading call is needed (cached, or empty patch), otherwise the
+    cleaned patch to grade.
+    """
+    cached = await get_cached(_cache_key(miner_submission))
+    if cached is not None:
+        LOGGER.info("Found cached grade for this patch, skipping grading call")
+        return FloatGraderScore.model_validate_json(cached)
 
-    OPENAI_CLIENT: Final[openai.Client] = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
-    cleaned_patch = preprocess_patch(repo, miner_solution.patch)
+    # Cloning and `git apply` block, so keep them off the event loop
+    cleaned_patch = await asyncio.to_thread(
+        preprocess_patch, miner_submission.repo, miner_submission.solution.patch
+    )
 
     if cleaned_patch == "":
         LOGGER.info(f"Patch is empty, terminating early...")
         return EMPTY_PATCH_SCORE
 
+    return cleaned_patch
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+async def _grade_miner_solution(
+    generated_problem_statement: GeneratedProblemStatement,
+    cleaned_patch_context: str,
+    openai_client: openai.AsyncClient,
+    semaphore: asyncio.Semaphore,
+) -> FloatGraderScore:
     # logger.info(f"Cleaned context:\n{cleaned_patch_context}\n\n")
     solution_context = SOLUTION_CONTEXT_TMPL.format(
         problem_statement=generated_problem_statement.problem_statement,
-        cleaned_patch_context=cleaned_patch,
+        cleaned_patch_context=cleaned_patch_context,
         dynamic_checklist=generated_problem_statement.dynamic_checklist,
         affected_files=generated_problem_statement.prompt,  # todo: fix this
     )
 
     LOGGER.info("Making call to grade code...")
-    completion = OPENAI_CLIENT.beta.chat.completions.parse(
-        model='gpt-4o-2024-08-06',
-        messages=[
-            {"role": "system", "content": GRADER_SYSTEM_PROMPT},
-            {"role": "user", "content": solution_context},
-        ],
-        response_format=FloatGraderScore,
-    )
+    async with semaphore:
+        completion = await openai_client.beta.chat.completions.parse(
+            model='gpt-4o-2024-08-06',
+            messages=[
+                {"role": "system", "content": GRADER_SYSTEM_PROMPT},
+                {"role": "user", "content": solution_context},
+            ],
+            response_format=FloatGraderScore,
+        )
     miner_output_score: FloatGraderScore = completion.choices[0].message.parsed
     LOGGER.info("Finished making call to grade code")
 
@@ -161,7 +251,8 @@ if __name__ == "__main__":
                 model="gpt-4o",
                 context_files=[]
             ),
-            solution=sample_diff
+            solution=sample_diff,
+            miner_hotkey="sample-hotkey",
     )])
 
     LOGGER.info(f"Grade response {scores}")
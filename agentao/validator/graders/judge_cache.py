@@ -0,0 +1,53 @@
+import asyncio
+import atexit
+import hashlib
+import shelve
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Final, Optional
+
+JUDGE_CACHE_PATH: Final[Path] = Path(".cache/judge")
+
+_JUDGE_CACHE_LOCK: Final[threading.Lock] = threading.Lock()
+_judge_cache: Optional[shelve.Shelf] = None
+
+
+# The same problem and patches make up the keys of many matches, so each is only hashed once
+@lru_cache(maxsize=4096)
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_key(*parts: str) -> str:
+    """Content-addressed cache key, built from the sha256 of each part"""
+    return ":".join(hash_text(part) for part in parts)
+
+
+def _get_cache() -> shelve.Shelf:
+    """Opened once and shared by every grading run, rather than reopening the dbm file per lookup"""
+    global _judge_cache
+    if _judge_cache is None:
+        JUDGE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _judge_cache = shelve.open(str(JUDGE_CACHE_PATH))
+        atexit.register(_judge_cache.close)
+    return _judge_cache
+
+
+def _get_cached_sync(key: str) -> Optional[str]:
+    with _JUDGE_CACHE_LOCK:
+        return _get_cache().get(key)
+
+
+def _set_cached_sync(key: str, value: str) -> None:
+    with _JUDGE_CACHE_LOCK:
+        _get_cache()[key] = value
+
+
+# dbm reads and writes block, so they run off the event loop the graders share
+async def get_cached(key: str) -> Optional[str]:
+    return await asyncio.to_thread(_get_cached_sync, key)
+
+
+async def set_cached(key: str, value: str) -> None:
+    await asyncio.to_thread(_set_cached_sync, key, value)
@@ -16,7 +16,7 @@ class TrueSkillGrader(GraderInterface):
         self.ratings: Dict[str, trueskill.Rating] = {}
         self.float_grader = FloatGrader()
         self.num_runs = 0
-        self.apha = np.log(4) / self.env.beta
+        self.alpha = np.log(4) / self.env.beta
 
     def grade(self, submissions: List[MinerSubmission]) -> List[float]:
         # Initialize any new miners
@@ -32,14 +32,20 @@ class TrueSkillGrader(GraderInterface):
         for _ in range(num_runs):
             self.update_ratings(submissions, float_scores)
 
-        ratings = []
-        mean_score = np.mean([r.mu - 3*r.sigma for r in self.ratings.values()])
-        for submission in submissions:
-            miner_rating = self.ratings[submission.miner_hotkey]
-            miner_rating = miner_rating.mu - 3 * miner_rating.sigma
-            ratings.append(1 / (1 + np.exp(-self.apha * (miner_rating - mean_score))))
+        # Conservative skill estimate (mu - 3 sigma) for every known miner, and for the submitters
+        mean_score = np.fromiter(
+            (r.mu - 3 * r.sigma for r in self.ratings.values()),
+            dtype=np.float64,
+            count=len(self.ratings),
+        ).mean()
+        miner_skills = np.fromiter(
+            (self.ratings[s.miner_hotkey].mu - 3 * self.ratings[s.miner_hotkey].sigma for s in submissions),
+            dtype=np.float64,
+            count=len(submissions),
+        )
 
-        return ratings
+        ratings = 1 / (1 + np.exp(-self.alpha * (miner_skills - mean_score)))
+        return ratings.tolist()
 
     def update_ratings(
             self, 
@@ -55,18 +61,10 @@ class TrueSkillGrader(GraderInterface):
 
         sorted_scores = sorted(raw_scores.items(), key=lambda x: x[1], reverse=True)
 
-        ratings_groups = []
-        for k, v in self.ratings.items():
-            if k in raw_scores:
-                ratings_groups.append({k: v})
+        rank_of = {mhk: i for i, (mhk, _) in enumerate(sorted_scores)}
 
-        ranks = []
-        for x in ratings_groups:
-            for mhk, _ in x.items():
-                for i, (mhk2, _) in enumerate(sorted_scores):
-                    if mhk == mhk2:
-                        ranks.append(i)
-                        break
+        ratings_groups = [{mhk: self.ratings[mhk]} for mhk in raw_scores]
+        ranks = [rank_of[mhk] for mhk in raw_scores]
 
         new_ratings = self.env.rate(ratings_groups, ranks=ranks)
 
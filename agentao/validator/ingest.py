@@ -9,167 +9,361 @@ If you've changed heuristics, run get_all_filepairs(local_path, refresh=True)
 to regen the cache
 """
 
-import json
+import hashlib
 import os
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
+from functools import lru_cache
 from pathlib import Path
 from typing import *
 from typing import List
 
 import numpy as np
 import openai
+import orjson
 import tiktoken
 
-from agentao.helpers.classes import EmbeddedFile, FilePair, IngestionHeuristics
+from agentao.helpers.classes import (
+    CachedDirectory, EmbeddedFile, FilePair, IngestionHeuristics, RepoDirectory, RepoFile
+)
 from agentao.helpers.clients import LOGGER
 
 
 OPENAI_CLIENT: Final[openai.Client] = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
 
+EMBEDDING_MODEL: Final[str] = "text-embedding-3-small"
+EMBEDDING_NORM_EPSILON: Final[float] = 1e-12
+# Embeddings are kept at half precision in memory and in the caches, and only widened for the matmul
+EMBEDDING_DTYPE: Final[type] = np.float16
+SIMILARITY_BLOCK_SIZE: Final[int] = 512
+MAX_EMBEDDING_INPUT_TOKENS: Final[int] = 8191
+MAX_EMBEDDING_INPUTS_PER_REQUEST: Final[int] = 2048
+MAX_EMBEDDING_TOKENS_PER_REQUEST: Final[int] = 300_000
+
+FILE_READ_WORKERS: Final[int] = 32
+MAX_CONCURRENT_EMBEDDING_REQUESTS: Final[int] = 4
+
 SAMPLE_INGESTION_HEURISTICS = IngestionHeuristics(
     min_files_to_consider_dir_for_problems=5,
     min_file_content_len=50
 )
 
 
-def walk_repository(repo_path: Path) -> Dict:
+def walk_repository(repo_path: Path) -> Dict[str, RepoDirectory]:
     """
     Picks files to generate problem statements from
     """
     repo_map = {}
 
-    for root, dirs, files in os.walk(str(repo_path)):
+    # Depth-first, in the same order as os.walk, but using the file types scandir already read
+    # from the directory instead of a stat per entry
+    pending_dirs = [str(repo_path)]
+    while pending_dirs:
+        root = pending_dirs.pop()
+
         # Convert absolute path to relative path from repo root
         rel_path = os.path.relpath(root, str(repo_path))
         if rel_path == '.':
             rel_path = ''
 
-        # Filter out common files/directories to ignore
-        dirs[:] = [d for d in dirs if not d.startswith(('.', '__'))]
-        files = [f for f in files if not f.startswith(('.', '__')) and not f.endswith(('.pyc', '.pyo')) and f.endswith('.py')]
+        dirs, files = [], []
+        # Size and mtime let later steps tell whether a directory changed without reading it
+        file_stats = {}
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    # Filter out common files/directories to ignore
+                    if entry.name.startswith(('.', '__')):
+                        continue
+
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.name.endswith('.py') and entry.is_file():
+                        stat = entry.stat()
+                        files.append(entry.name)
+                        file_stats[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            LOGGER.exception(f"Warning: Could not list directory {root}")
+            continue
 
         # Add to map
-        repo_map[rel_path] = {
-            'dirs': dirs,
-            'files': files
-        }
+        repo_map[rel_path] = RepoDirectory(
+            dirs=dirs,
+            files=files,
+            file_stats=file_stats
+        )
+
+        pending_dirs.extend(os.path.join(root, d) for d in reversed(dirs))
 
     return repo_map
 
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def evaluate_for_context(dir_path, repo_structure, heuristics: IngestionHeuristics):
-
-    def _retrieve_files_in_dir():
-        # Get all files in the current directory
-        files = []
-        for file_name in repo_structure['files']:
-            path = os.path.join(dir_path, file_name)
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    contents = f.read()
-                files.append(
-                    {
-                        'path': path,
-                        'contents': contents
-                    }
-                )
-            except (UnicodeDecodeError, IOError):
-                LOGGER.exception(f"Warning: Could not read file {path}")
-                continue
-
-        return files
-
-    def _embed_code(raw_codes: List[str]) -> List[List[float]]:
-        encoding = tiktoken.get_encoding('cl100k_base')
-        truncated_inputs = [encoding.encode(json.dumps(code))[:8191] for code in raw_codes]
-        response = OPENAI_CLIENT.embeddings.create(
-            model="text-embedding-3-small",
-            input=truncated_inputs
-        )
-        # Return list of embedding vectors
-        return [data.embedding for data in response.data]
-
-    def _find_most_similar_files(embedded_files: List[EmbeddedFile]) -> FilePair | None:
-        max_similarity = -1
-        most_similar_pair = None
-
-        # Compare each pair of files
-        for i in range(len(embedded_files)):
-            for j in range(i + 1, len(embedded_files)):
-                similarity = cosine_similarity(
-                    embedded_files[i].embedding,
-                    embedded_files[j].embedding
-                )
-
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_pair = [embedded_files[i], embedded_files[j]]
-
-        if most_similar_pair is None:
-            return None
-
-        return FilePair(
-            cosine_similarity=max_similarity,
-            files=most_similar_pair
-        )
+def _read_file(path: str) -> str | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (UnicodeDecodeError, IOError):
+        LOGGER.exception(f"Warning: Could not read file {path}")
+        return None
+
+
+# Loaded on first use rather than at import, since the first load may download the encoding
+@lru_cache(maxsize=1)
+def _embedding_encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding('cl100k_base')
+
+
+def _embed_code(raw_codes: List[str]) -> np.ndarray:
+    truncated_inputs = [
+        tokens[:MAX_EMBEDDING_INPUT_TOKENS] for tokens in _embedding_encoding().encode_ordinary_batch(raw_codes)
+    ]
+
+    # Embed everything in as few requests as the endpoint's input count and token limits allow
+    chunks = []
+    chunk, chunk_tokens = [], 0
+    for tokens in truncated_inputs:
+        if chunk and (
+            len(chunk) == MAX_EMBEDDING_INPUTS_PER_REQUEST
+            or chunk_tokens + len(tokens) > MAX_EMBEDDING_TOKENS_PER_REQUEST
+        ):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(tokens)
+        chunk_tokens += len(tokens)
+    if chunk:
+        chunks.append(chunk)
+
+    # The requests are network-bound, so keep several in flight. map preserves chunk order
+    embeddings = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_EMBEDDING_REQUESTS) as executor:
+        for chunk_embeddings in executor.map(_request_embeddings, chunks):
+            embeddings.extend(chunk_embeddings)
+
+    # Normalize once here, so every cached embedding is unit length and cosine similarity is a bare dot
+    # product. Return an (N, D) float16 matrix, one embedding vector per row
+    embeddings = np.array(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + EMBEDDING_NORM_EPSILON
+    return embeddings.astype(EMBEDDING_DTYPE)
+
+
+def _request_embeddings(inputs: List[List[int]]) -> List[List[float]]:
+    response = OPENAI_CLIENT.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=inputs
+    )
+    return [data.embedding for data in response.data]
+
+
+def _find_most_similar_files(embedded_files: List[EmbeddedFile]) -> FilePair | None:
+    if len(embedded_files) < 2:
+        return None
+
+    # Embeddings are unit length already, so a matmul gives pairwise cosine similarities. NumPy has no
+    # float16 BLAS, so the matmul runs in float32
+    embeddings = np.asarray([f.embedding for f in embedded_files], dtype=np.float32)
+
+    n = len(embedded_files)
+    if n <= SIMILARITY_BLOCK_SIZE:
+        similarities = embeddings @ embeddings.T
+
+        # Only compare each pair once, skipping self-similarity on the diagonal
+        rows, cols = np.triu_indices(n, k=1)
+        best = int(np.argmax(similarities[rows, cols]))
+        i, j = rows[best], cols[best]
+        best_similarity = similarities[i, j]
+    else:
+        # Large directories: go through the similarity matrix a block of rows at a time, so memory
+        # stays O(n * block) instead of O(n^2)
+        best_similarity, i, j = -np.inf, 0, 1
+        for start in range(0, n, SIMILARITY_BLOCK_SIZE):
+            block = embeddings[start:start + SIMILARITY_BLOCK_SIZE] @ embeddings.T
+            # Same pairs as the upper triangle above, so ties resolve to the same pair
+            block_rows = np.arange(start, start + block.shape[0])[:, None]
+            block[np.arange(n)[None, :] <= block_rows] = -np.inf
+
+            row, col = np.unravel_index(int(np.argmax(block)), block.shape)
+            if block[row, col] > best_similarity:
+                best_similarity, i, j = block[row, col], start + row, col
+
+    return FilePair(
+        cosine_similarity=float(best_similarity),
+        files=[embedded_files[i], embedded_files[j]]
+    )
+
+
+def _directory_signature(dir_path: str, repo_structure: RepoDirectory, heuristics: IngestionHeuristics) -> str:
+    """Changes whenever a file in the directory is added, removed or modified, or the heuristics or model change"""
+    file_stats = sorted(repo_structure['file_stats'].items())
+    return hashlib.sha256(repr((dir_path, file_stats, asdict(heuristics), EMBEDDING_MODEL)).encode()).hexdigest()
+
+
+def _content_hash(contents: str) -> str:
+    """Embedding cache key; includes the model, since vectors from different models are not comparable"""
+    return f"{EMBEDDING_MODEL}:{hashlib.sha256(contents.encode('utf-8')).hexdigest()}"
+
 
-    if len(repo_structure['files']) >= heuristics.min_files_to_consider_dir_for_problems:
-        files = _retrieve_files_in_dir()
-        embeddings = _embed_code(list(map(lambda file: file['contents'], files)))
+def evaluate_for_context(
+    repo_files: List[Tuple[str, RepoDirectory]],
+    heuristics: IngestionHeuristics,
+    cache_path: str,
+    refresh: bool = False,
+) -> List[FilePair]:
+    """
+    Finds the most similar file pair in each directory.
+
+    Files of every eligible directory are embedded together in one pass, rather than
+    one embedding request per directory, then split back up by directory.
+    Unless `refresh` is set, directories whose files are unchanged since the last run reuse their
+    cached pair, and files whose contents were embedded before (in any directory) reuse their
+    cached embedding. The cache is rewritten with only the repo's current directories and files,
+    so it never grows past one copy of the repo.
+    """
+    cached_dirs, cached_embeddings = ({}, {}) if refresh else load_filepairs_from_cache(cache_path)
+
+    # Pass 1: collect the files worth embedding, remembering which directory each came from
+    dir_entries: Dict[str, Optional[CachedDirectory]] = {}
+    changed_dirs = []
+    for dir_path, repo_structure in repo_files:
+        if len(repo_structure['files']) < heuristics.min_files_to_consider_dir_for_problems:
+            continue
+
+        signature = _directory_signature(dir_path, repo_structure, heuristics)
+        cached = cached_dirs.get(dir_path)
+        if cached is not None and cached['signature'] == signature:
+            dir_entries[dir_path] = cached
+            continue
+
+        paths = [os.path.join(dir_path, file_name) for file_name in repo_structure['files']]
+        changed_dirs.append((dir_path, signature, paths))
+        dir_entries[dir_path] = None
+
+    # Reading is I/O-bound, so read the files of every changed directory in parallel
+    with ThreadPoolExecutor(max_workers=FILE_READ_WORKERS) as executor:
+        all_contents = iter(list(executor.map(
+            _read_file, [path for _, _, paths in changed_dirs for path in paths]
+        )))
+
+    pending_dirs = []
+    for dir_path, signature, paths in changed_dirs:
+        files = [
+            RepoFile(path=path, contents=contents, hash=_content_hash(contents))
+            for path, contents in zip(paths, all_contents)
+            if contents is not None and len(contents) > heuristics.min_file_content_len
+        ]
+        pending_dirs.append((dir_path, signature, files))
+
+    # Pass 2: embed every file not seen before at once
+    embeddings_by_hash = dict(cached_embeddings)
+    contents_to_embed = {
+        file['hash']: file['contents']
+        for _, _, files in pending_dirs
+        for file in files
+        if file['hash'] not in embeddings_by_hash
+    }
+    if contents_to_embed:
+        LOGGER.info(f"Embedding {len(contents_to_embed)} new files")
+        embeddings = _embed_code(list(contents_to_embed.values()))
+        embeddings_by_hash.update(zip(contents_to_embed, embeddings))
+
+    # Pass 3: scatter the embeddings back to their directories
+    for dir_path, signature, files in pending_dirs:
         embedded_files = [
             EmbeddedFile(
                 path=file['path'],
                 contents=file['contents'],
-                embedding=embeddings[i]
+                embedding=embeddings_by_hash[file['hash']]
             )
-            for i, file in enumerate(files)
-            if len(file['contents']) > heuristics.min_file_content_len
+            for file in files
         ]
 
-        most_similar_files = _find_most_similar_files(embedded_files)
+        dir_entries[dir_path] = CachedDirectory(
+            signature=signature,
+            hashes=[file['hash'] for file in files],
+            pair=_find_most_similar_files(embedded_files),
+        )
 
-        return most_similar_files
-    else:
-        return []
+    if refresh or changed_dirs or dir_entries.keys() != cached_dirs.keys():
+        save_filepairs_to_cache(dir_entries, embeddings_by_hash, cache_path)
 
-def save_filepairs_to_cache(filepairs: List[FilePair], cache_path: str) -> None:
-    """Save list of FilePairs to local cache."""
+    return [entry['pair'] for entry in dir_entries.values() if entry['pair'] is not None]
+
+def save_filepairs_to_cache(
+    dir_entries: Dict[str, CachedDirectory],
+    embeddings_by_hash: Dict[str, np.ndarray],
+    cache_path: str,
+) -> None:
+    """
+    Save each directory's FilePair, and the embeddings of its files, to local cache.
+
+    Embeddings go into one contiguous float16 array in `<cache_path>.npy`, everything else into a
+    `<cache_path>.json` index whose content hashes point at their row in that array. Only the
+    embeddings of the given directories are kept, which is what evicts files that are gone.
+    """
     cache_dir = Path(cache_path).parent
     cache_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Convert FilePairs to serializable format
-    serializable_pairs = [
-        {
-            'cosine_similarity': pair.cosine_similarity,
-            'files': [asdict(f) for f in pair.files]
-        }
-        for pair in filepairs
-    ]
-    
-    with open(cache_path, 'wb') as f:
-        pickle.dump(serializable_pairs, f)
 
-def load_filepairs_from_cache(cache_path: str) -> List[FilePair]:
-    """Load FilePairs from cache, returns empty list if cache doesn't exist."""
+    kept_hashes = list(dict.fromkeys(h for entry in dir_entries.values() for h in entry['hashes']))
+    embeddings = np.asarray([embeddings_by_hash[h] for h in kept_hashes], dtype=EMBEDDING_DTYPE)
+    index = {
+        'rows': {h: row for row, h in enumerate(kept_hashes)},
+        'dirs': {
+            dir_path: {
+                'signature': entry['signature'],
+                'hashes': entry['hashes'],
+                'pair': None if entry['pair'] is None else {
+                    'cosine_similarity': entry['pair'].cosine_similarity,
+                    'files': [
+                        {'path': f.path, 'contents': f.contents, 'hash': _content_hash(f.contents)}
+                        for f in entry['pair'].files
+                    ]
+                },
+            }
+            for dir_path, entry in dir_entries.items()
+        },
+    }
+
+    # Write next to the old files and swap them in, since the old .npy may still be memory-mapped
+    with open(f"{cache_path}.npy.tmp", 'wb') as f:
+        np.save(f, embeddings)
+    with open(f"{cache_path}.json.tmp", 'wb') as f:
+        f.write(orjson.dumps(index))
+    os.replace(f"{cache_path}.npy.tmp", f"{cache_path}.npy")
+    os.replace(f"{cache_path}.json.tmp", f"{cache_path}.json")
+
+def load_filepairs_from_cache(cache_path: str) -> Tuple[Dict[str, CachedDirectory], Dict[str, np.ndarray]]:
+    """
+    Load each directory's cached FilePair and the cached embeddings by content hash. Both are empty
+    if the cache doesn't exist or can't be read.
+    """
     try:
-        with open(cache_path, 'rb') as f:
-            data = pickle.load(f)
-        
-        # Reconstruct FilePairs from serialized data
-        return [
-            FilePair(
-                cosine_similarity=pair['cosine_similarity'],
-                files=[EmbeddedFile(**f) for f in pair['files']]
+        with open(f"{cache_path}.json", 'rb') as f:
+            index = orjson.loads(f.read())
+        rows, dirs = index.get('rows'), index.get('dirs')
+        if not isinstance(rows, dict) or not isinstance(dirs, dict):
+            return {}, {}
+        # Memory-mapped, so each embedding is a view into the file rather than a copy
+        embeddings = np.load(f"{cache_path}.npy", mmap_mode='r')
+
+        embeddings_by_hash = {h: embeddings[row] for h, row in rows.items()}
+        dir_entries = {
+            dir_path: CachedDirectory(
+                signature=entry['signature'],
+                hashes=entry['hashes'],
+                pair=None if entry['pair'] is None else FilePair(
+                    cosine_similarity=entry['pair']['cosine_similarity'],
+                    files=[
+                        EmbeddedFile(path=f['path'], contents=f['contents'], embedding=embeddings_by_hash[f['hash']])
+                        for f in entry['pair']['files']
+                    ]
+                ),
             )
-            for pair in data
-        ]
-    except (FileNotFoundError, EOFError):
-        return []
-    
+            for dir_path, entry in dirs.items()
+        }
+    except (FileNotFoundError, ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return {}, {}
+
+    return dir_entries, embeddings_by_hash
+
 def get_all_filepairs(
     local_repo: Path, 
     heuristics: IngestionHeuristics = SAMPLE_INGESTION_HEURISTICS,
@@ -177,28 +371,17 @@ def get_all_filepairs(
 ) -> List[FilePair]:
     cache_path = f".cache/{local_repo}"
 
-    filepairs_from_cache = load_filepairs_from_cache(cache_path=cache_path)
-
-    if filepairs_from_cache and len(filepairs_from_cache) > 0 and refresh == False:
-        return filepairs_from_cache
-    
+    # Walking only stats files, so it is cheap enough to do every time to tell which directories changed
     repo_structure = walk_repository(local_repo)
 
-    file_pairs = []
-    for dir_path, contents in repo_structure.items():
-        full_path = os.path.join(local_repo, dir_path) if dir_path else local_repo
-        if contents['files']:
-            file_pairs.append(evaluate_for_context(full_path, contents, heuristics=heuristics))
-
-    valid_pairs = [pair for pair in file_pairs if pair and isinstance(pair, FilePair)]
+    repo_files = [
+        (os.path.join(local_repo, dir_path) if dir_path else local_repo, contents)
+        for dir_path, contents in repo_structure.items()
+        if contents['files']
+    ]
+    valid_pairs = evaluate_for_context(repo_files, heuristics=heuristics, cache_path=cache_path, refresh=refresh)
     if not valid_pairs:
         raise ValueError("No valid file pairs found in the repository. Ensure there are directories with 5+ Python files.")
-    
-    # Save the filepairs to cache
-    save_filepairs_to_cache(
-        filepairs=valid_pairs,
-        cache_path=cache_path
-    )
 
     return valid_pairs
 
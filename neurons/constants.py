@@ -2,6 +2,8 @@ from typing import Final
 
 NO_MINER_RESPONSE_SCORE: float = 0.005
 UPLOAD_ISSUE_ENDPOINT: Final[str] = "https://gh-issue-pull.onrender.com/upload_issue"
+HTTP_CONNECTION_LIMIT: Final[int] = 64
+HTTP_DNS_CACHE_TTL_S: Final[int] = 300
 DOCKER_CACHE_LEVEL: Final[str] = "instance"
 
 ## Validator eval constants
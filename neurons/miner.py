@@ -14,11 +14,14 @@
 # DEALINGS IN THE SOFTWARE.
 
 import argparse
+import asyncio
 import os
-import tempfile
-import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Final, Tuple
 
 import yaml
 
@@ -31,6 +34,19 @@ from agentao.helpers.helpers import clone_repo
 from agentao.miner.generate_solution import generate_code_patch
 from agentao.repo_environment import SUPPORTED_REPOS, REPO_TO_ENVIRONMENT_INFO
 
+# Prefer the libyaml-backed emitter when PyYAML was built with it
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+
+# Requests for the same repo share one working copy, so patches are generated one at a time
+MAX_CONCURRENT_PATCH_GENERATIONS: Final[int] = 1
+PATCH_GENERATION_EXECUTOR: Final[ThreadPoolExecutor] = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_PATCH_GENERATIONS, thread_name_prefix="patch-generation"
+)
+
 
 class MinerDefaults:
     MAX_INSTANCE_COST = 3.
@@ -60,6 +76,11 @@ class Miner(BaseMinerNeuron):
         self.max_instance_cost = max_instance_cost
         self.use_mock_responses = use_mock_responses
 
+        self.current_dir = Path.cwd()
+        self.jobs_dir = Path("jobs").absolute()
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        LOGGER.info("Using %s as the directory for code repositories", self.jobs_dir)
+
         super(Miner, self).__init__(config=config)
 
     async def forward(
@@ -80,54 +101,54 @@ class Miner(BaseMinerNeuron):
         """
         # if patch.txt exists return that
         LOGGER.info("Starting miner forward pass...")
-        LOGGER.info(f"Received a request with repo: {synapse.repo}, problem statement: {synapse.problem_statement[:50]}...")
-
-        current_dir = Path.cwd()
+        LOGGER.info(
+            "Received a request with repo: %s, problem statement: %.50s...", synapse.repo, synapse.problem_statement
+        )
 
         try:
-            repo = synapse.repo
-            author_name, repo_name = repo.split("/")
-
-            jobs_dir = Path("jobs")
-            jobs_dir.mkdir(parents=True, exist_ok=True)
-            LOGGER.info(f"Using {jobs_dir.absolute()} as the directory for code repositories")
-
-            LOGGER.info(f"Cloning repo {repo}...")
-            local_repo_dir = clone_repo(author_name, repo_name, current_dir.parent)
-            LOGGER.info(f"Finished cloning repo {repo}")
-
-            if repo not in SUPPORTED_REPOS:
-                raise ValueError(
-                    f"Repo {repo} is not configured on miner. "
-                    f"Please provide an environment setup file in REPO_TO_ENV_SETUP"
-                )
-
-            repo_environment_info = REPO_TO_ENVIRONMENT_INFO[repo]
-            with tempfile.NamedTemporaryFile(suffix=".yaml", mode="w") as temp_env_file:
-                yaml.dump(repo_environment_info.config_dict, temp_env_file)
-                temp_env_file.flush()
-
-                if self.use_mock_responses:
-                    synapse.patch = "dummy patch"
-                else:
-                    synapse.patch = generate_code_patch(
-                        self.model_name,
-                        UnsolvedIssue(
-                            desc=synapse.problem_statement,
-                            local_code_path=local_repo_dir,
-                            env_setup_path=Path(temp_env_file.name)
-                        ),
-                        self.max_instance_cost,
-                    ).patch
-
-            LOGGER.info(f"Finished generating code patch for repo {synapse.repo}")
-
-            LOGGER.info(f"Exiting miner forward pass for repo {synapse.repo}")
-            LOGGER.debug(f"Returning patch: {synapse.patch}")
+            # Run the blocking clone and patch generation off the event loop, so blacklist and
+            # priority keep answering concurrent requests in the meantime
+            synapse.patch = await asyncio.get_running_loop().run_in_executor(
+                PATCH_GENERATION_EXECUTOR, self.generate_patch, synapse.repo, synapse.problem_statement
+            )
+
+            LOGGER.info("Finished generating code patch for repo %s", synapse.repo)
+
+            LOGGER.info("Exiting miner forward pass for repo %s", synapse.repo)
+            LOGGER.debug("Returning patch: %s", synapse.patch)
             return synapse
         except Exception:
             LOGGER.exception("Error processing request")
 
+    def generate_patch(self, repo: str, problem_statement: str) -> str:
+        """Clones the repo and runs SWE-agent on the problem statement, blocking until a patch is produced."""
+        author_name, repo_name = repo.split("/")
+
+        LOGGER.info("Cloning repo %s...", repo)
+        local_repo_dir = clone_repo(author_name, repo_name, self.current_dir.parent)
+        LOGGER.info("Finished cloning repo %s", repo)
+
+        if repo not in SUPPORTED_REPOS:
+            raise ValueError(
+                f"Repo {repo} is not configured on miner. "
+                "Please provide an environment setup file in REPO_TO_ENV_SETUP"
+            )
+
+        env_setup_path = write_env_setup_file(repo, self.jobs_dir)
+
+        if self.use_mock_responses:
+            return "dummy patch"
+
+        return generate_code_patch(
+            self.model_name,
+            UnsolvedIssue(
+                desc=problem_statement,
+                local_code_path=local_repo_dir,
+                env_setup_path=env_setup_path
+            ),
+            self.max_instance_cost,
+        ).patch
+
     async def blacklist(
         self, synapse: agentao.protocol.CodingTask
     ) -> Tuple[bool, str]:
@@ -165,28 +186,19 @@ class Miner(BaseMinerNeuron):
             LOGGER.warning("Received a request without a dendrite or hotkey.")
             return True, "Missing dendrite or hotkey"
 
-        uid = self.metagraph.hotkeys.index(synapse.dendrite.hotkey)
-        if (
-            not self.config.blacklist.allow_non_registered
-            and synapse.dendrite.hotkey not in self.metagraph.hotkeys
-        ):
+        uid = self.hotkey_to_uid.get(synapse.dendrite.hotkey)
+        if not self.config.blacklist.allow_non_registered and uid is None:
             # Ignore requests from un-registered entities.
-            LOGGER.info(
-                f"Blacklisting un-registered hotkey {synapse.dendrite.hotkey}"
-            )
+            LOGGER.info("Blacklisting un-registered hotkey %s", synapse.dendrite.hotkey)
             return True, "Unrecognized hotkey"
 
         if self.config.blacklist.force_validator_permit:
             # If the config is set to force validator permit, then we should only allow requests from validators.
-            if not self.metagraph.validator_permit[uid]:
-                LOGGER.warning(
-                    f"Blacklisting a request from non-validator hotkey {synapse.dendrite.hotkey}"
-                )
+            if uid is None or not self.metagraph.validator_permit[uid]:
+                LOGGER.warning("Blacklisting a request from non-validator hotkey %s", synapse.dendrite.hotkey)
                 return True, "Non-validator hotkey"
 
-        LOGGER.info(
-            f"Not Blacklisting recognized hotkey {synapse.dendrite.hotkey}"
-        )
+        LOGGER.info("Not Blacklisting recognized hotkey %s", synapse.dendrite.hotkey)
         return False, "Hotkey recognized!"
 
     async def priority(self, synapse: agentao.protocol.CodingTask) -> float:
@@ -213,25 +225,51 @@ class Miner(BaseMinerNeuron):
             LOGGER.warning("Received a request without a dendrite or hotkey.")
             return 0.0
         
-        caller_uid = self.metagraph.hotkeys.index(
-            synapse.dendrite.hotkey
-        )  # Get the caller index.
+        caller_uid = self.hotkey_to_uid[synapse.dendrite.hotkey]  # Get the caller index.
         priority = float(
             self.metagraph.S[caller_uid]
         )  # Return the stake as the priority.
-        LOGGER.info(
-            f"Prioritizing {synapse.dendrite.hotkey} with value: {priority}"
-        )
+        LOGGER.info("Prioritizing %s with value: %s", synapse.dendrite.hotkey, priority)
         return priority
 
 
+@lru_cache(maxsize=None)
+def write_env_setup_file(repo: str, jobs_dir: Path) -> Path:
+    """
+    Writes the repo's environment setup YAML for SWE-agent once per process.
+
+    The environment config is static per repo, so the file is reused by every request
+    instead of being dumped to a fresh temporary file each time.
+    """
+    author_name, repo_name = repo.split("/")
+    env_setup_path = jobs_dir / f"{author_name}_{repo_name}.env.yaml"
+
+    # Write to a sibling file and rename, so a concurrent reader never sees a partial file
+    tmp_path = env_setup_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        yaml.dump(REPO_TO_ENVIRONMENT_INFO[repo].config_dict, f, Dumper=YamlDumper)
+    os.replace(tmp_path, env_setup_path)
+
+    return env_setup_path
+
+
 def init_swe_agent(model_name: str) -> None:
     """Creates keys.cfg file from envars"""
     envar_names = [MODEL_NAME_TO_ENVAR_NAME[model_name]]
 
-    buffer = [f"{key}: '{os.environ[key]}'" for key in envar_names if key in os.environ]
-    with open("SWE-agent/keys.cfg", "w") as f:
-        f.write("\n".join(buffer) + "\n")
+    # repr quotes each value as a Python string literal, so keys containing quotes stay parseable
+    buffer = [f"{key}: {value!r}" for key in envar_names if (value := os.environ.get(key)) is not None]
+    contents = "\n".join(buffer) + "\n"
+
+    # Leave the file untouched when it already holds the same keys
+    keys_cfg_path = Path("SWE-agent/keys.cfg")
+    try:
+        if keys_cfg_path.read_text() == contents:
+            return
+    except FileNotFoundError:
+        pass
+
+    keys_cfg_path.write_text(contents)
 
 
 def parse_args() -> argparse.Namespace:
@@ -251,5 +289,8 @@ def parse_args() -> argparse.Namespace:
 # This is the main function, which runs the miner.
 if __name__ == "__main__":
     with Miner(**vars(parse_args())) as miner:
-        while True:
-            time.sleep(5)
+        # Block until asked to stop rather than polling; exiting the context stops the miner
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        stop.wait()
@@ -14,6 +14,7 @@
 # DEALINGS IN THE SOFTWARE.
 
 import argparse
+import asyncio
 import random
 import time
 from datetime import timedelta
@@ -21,20 +22,23 @@ from pathlib import Path
 from typing import *
 
 import numpy as np
-from aiohttp import BasicAuth, ClientSession
+import orjson
+from aiohttp import BasicAuth, ClientSession, TCPConnector
 
-from neurons.constants import UPLOAD_ISSUE_ENDPOINT, LLM_EVAL_MULT, PROCESS_TIME_MULT
+from neurons.constants import UPLOAD_ISSUE_ENDPOINT, LLM_EVAL_MULT, PROCESS_TIME_MULT, HTTP_CONNECTION_LIMIT, \
+    HTTP_DNS_CACHE_TTL_S
 from agentao.base.validator import BaseValidatorNeuron, TaskType
 from agentao.helpers.classes import GeneratedProblemStatement, IngestionHeuristics, \
-    IssueSolution
+    IssueSolution, to_json_bytes
 from agentao.helpers.clients import LOGGER
 from agentao.helpers.constants import SUPPORTED_VALIDATOR_MODELS
-from agentao.helpers.helpers import clone_repo, exponential_decay
+from agentao.helpers.helpers import clone_repo, exponential_decay_batch
 from agentao.protocol import CodingTask
 from agentao.repo_environment import SUPPORTED_REPOS
-from agentao.utils.uids import check_uid_availability
+from agentao.utils.uids import get_available_uids
 from agentao.validator.generate_problem import create_problem_statements
 from agentao.validator.graders.abstract_grader import MinerSubmission
+from agentao.validator.graders.helpers import prepare_eval_repo
 from agentao.validator.graders.trueskill_grader import TrueSkillGrader
 from neurons.constants import UPLOAD_ISSUE_ENDPOINT
 
@@ -70,6 +74,29 @@ class Validator(BaseValidatorNeuron):
         self.model_name = model
         self.miner_request_timeout_mins = miner_request_timeout
         self.grader = TrueSkillGrader()
+        # The grader's ratings are shared state, so concurrent forward passes grade one at a time
+        self.grading_lock = asyncio.Lock()
+        self.problem_generation_lock = asyncio.Lock()
+        # Created on first use, so it is bound to the loop the forward passes run on
+        self.http_session: Optional[ClientSession] = None
+
+        # The endpoint only checks a signature of our own hotkey, so it is signed once, not per upload
+        keypair = self.dendrite.keypair
+        self.upload_auth = BasicAuth(keypair.ss58_address, f"0x{keypair.sign(keypair.ss58_address).hex()}")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        # The run thread drives self.loop; only close the session here once it has stopped
+        if self.http_session is not None and not (self.thread and self.thread.is_alive()):
+            self.loop.run_until_complete(self.http_session.close())
+
+    def get_http_session(self) -> ClientSession:
+        """Shared session, so uploads reuse keep-alive connections instead of handshaking every time."""
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = ClientSession(
+                connector=TCPConnector(limit=HTTP_CONNECTION_LIMIT, ttl_dns_cache=HTTP_DNS_CACHE_TTL_S),
+            )
+        return self.http_session
 
     async def calculate_rewards(
         self,
@@ -82,20 +109,23 @@ class Validator(BaseValidatorNeuron):
         """
         Validate the responses from the miners. This function should score the responses and return a list of rewards for each miner.
         """
-        llm_evals = self.grader.grade([
+        submissions = [
             MinerSubmission(
                 repo=repo, 
                 problem=problem, 
-                solution=issue_solution
+                solution=issue_solution,
+                miner_hotkey=hk,
             ) for issue_solution, hk in zip(issue_solutions, miner_hotkeys)
-        ])
+        ]
+        # Grading blocks on LLM calls and patch checks, so it runs in a worker thread to keep the
+        # other concurrent forward passes moving
+        async with self.grading_lock:
+            llm_evals = await asyncio.to_thread(self.grader.grade, submissions)
 
-        response_times = np.array([
-            exponential_decay(self.miner_request_timeout_mins * 60, t)
-            for t in process_times
-        ])
+        response_times = exponential_decay_batch(self.miner_request_timeout_mins * 60, process_times)
 
-        return LLM_EVAL_MULT*llm_evals + PROCESS_TIME_MULT*response_times
+        # Graders return plain lists, so convert before scaling; a list * float would raise
+        return LLM_EVAL_MULT*np.asarray(llm_evals, dtype=np.float64) + PROCESS_TIME_MULT*response_times
     
     # TODO: Add more fields once components of scoring are named
     async def upload_solution(
@@ -110,30 +140,28 @@ class Validator(BaseValidatorNeuron):
         """
         response_patches = [response.patch for response in responses]
 
-        keypair = self.dendrite.keypair
-        hotkey = keypair.ss58_address
-        signature = f"0x{keypair.sign(hotkey).hex()}"
         try:
-            async with ClientSession() as session:
-                # TODO: Add how long it takes to upload the issue
-                payload = [{
-                    "problem_statement": problem_statement,
-                    "solution_patch": response_patch,
-                    "score": response_score,
-                    "miner_hotkey": miner_hotkey,
-                } for
-                    response_patch,
-                    response_score,
-                    miner_hotkey
-                    in zip(response_patches, rewards_list, hotkeys)
-                ]
-                async with session.post(
-                    url=UPLOAD_ISSUE_ENDPOINT,
-                    auth=BasicAuth(hotkey, signature),
-                    json=payload,
-                ) as response:
-                    response.raise_for_status()
-                    _result = await response.json()
+            # TODO: Add how long it takes to upload the issue
+            session = self.get_http_session()
+            payload = [{
+                "problem_statement": problem_statement,
+                "solution_patch": response_patch,
+                "score": response_score,
+                "miner_hotkey": miner_hotkey,
+            } for
+                response_patch,
+                response_score,
+                miner_hotkey
+                in zip(response_patches, rewards_list, hotkeys)
+            ]
+            async with session.post(
+                url=UPLOAD_ISSUE_ENDPOINT,
+                auth=self.upload_auth,
+                data=to_json_bytes(payload),
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                response.raise_for_status()
+                _result = orjson.loads(await response.read())
         except Exception:
             LOGGER.exception("Error uploading closed issue")
 
@@ -148,10 +176,7 @@ class Validator(BaseValidatorNeuron):
         """
         LOGGER.debug("Starting forward pass...")
 
-        miner_uids = [
-            uid for uid in range(len(self.metagraph.S))
-            if check_uid_availability(self.metagraph, uid, self.config.neuron.vpermit_tao_limit)
-        ]
+        miner_uids: List[int] = get_available_uids(self.metagraph, self.config.neuron.vpermit_tao_limit).tolist()
         LOGGER.info(f"Miner UIDs: {miner_uids}")
 
         if len(miner_uids) == 0:
@@ -159,6 +184,7 @@ class Validator(BaseValidatorNeuron):
             return
 
         axons = [self.metagraph.axons[uid] for uid in miner_uids]
+        uid_by_axon_hotkey = {axon.hotkey: uid for uid, axon in zip(miner_uids, axons)}
 
         LOGGER.info(f"Current step={self.step}...")
 
@@ -167,20 +193,27 @@ class Validator(BaseValidatorNeuron):
 
         author_name, repo_name = repo.split("/")
 
-        LOGGER.info(f"Cloning repo {repo}...")
-        local_repo_dir = clone_repo(author_name, repo_name, current_dir.parent)
-        LOGGER.info(f"Finished cloning repo {repo}")
-
+        # Cloning and problem generation block on git and LLM calls, so they run in a worker thread.
+        # Concurrent forward passes share the working copies and ingestion caches, so only one at a time
         num_problems_to_gen = 1
-        problems: List[GeneratedProblemStatement] = create_problem_statements(
-            self.model_name, repo, local_repo_dir, num_problems_to_gen, ValidatorDefaults.INGESTION_HEURISTICS
-        )
+        async with self.problem_generation_lock:
+            LOGGER.info(f"Cloning repo {repo}...")
+            local_repo_dir = await asyncio.to_thread(clone_repo, author_name, repo_name, current_dir.parent)
+            LOGGER.info(f"Finished cloning repo {repo}")
+
+            problems: List[GeneratedProblemStatement] = await asyncio.to_thread(
+                create_problem_statements,
+                self.model_name, repo, local_repo_dir, num_problems_to_gen, ValidatorDefaults.INGESTION_HEURISTICS
+            )
         problem: GeneratedProblemStatement = problems[0]
         LOGGER.info(f"Problem statement is: {problem.problem_statement[:50]}...")
 
         # todo: create proper task ID
         task_id = f"{repo}-{problem.problem_statement[:10]}"
 
+        # Miners take minutes to answer; meanwhile, get the checkout their patches are graded against ready
+        eval_repo_task = asyncio.create_task(asyncio.to_thread(prepare_eval_repo, repo))
+
         LOGGER.info(f"Sending task {task_id} to miners, ...")
         responses: List[CodingTask] = await self.dendrite(
             axons=axons,
@@ -192,10 +225,17 @@ class Validator(BaseValidatorNeuron):
             deserialize=False,
             timeout=timedelta(minutes=self.miner_request_timeout_mins).total_seconds(),
         )
+        try:
+            await eval_repo_task
+        except Exception:
+            # Grading retries the clone itself, so this only costs the head start
+            LOGGER.exception(f"Failed to prepare the evaluation checkout of {repo}")
+
         LOGGER.info(f"Received patches from miners for task {task_id}: "
                     f"{[(r.patch[:100] + '...' if r.patch else r.patch) for r in responses]}")
 
         working_miner_uids: List[int] = []
+        working_miner_hotkeys: List[str] = []
         finished_responses: List[IssueSolution] = []
         process_times: List[float] = []
 
@@ -207,8 +247,9 @@ class Validator(BaseValidatorNeuron):
                 LOGGER.info(f"Miner with hotkey {response.axon.hotkey} gave a response object but no patch")
             else:
                 LOGGER.info(f"Miner with hotkey {response.axon.hotkey} gave a valid response/patch")
-                uid = next(uid for uid, axon in zip(miner_uids, axons) if axon.hotkey == response.axon.hotkey)
+                uid = uid_by_axon_hotkey[response.axon.hotkey]
                 working_miner_uids.append(uid)
+                working_miner_hotkeys.append(response.axon.hotkey)
                 finished_responses.append(IssueSolution(response.patch))
                 process_times.append(response.dendrite.process_time)
 
@@ -225,6 +266,7 @@ class Validator(BaseValidatorNeuron):
             finished_responses, 
             process_times,
             working_miner_uids,
+            working_miner_hotkeys,
         )
 
 
@@ -235,8 +277,9 @@ class Validator(BaseValidatorNeuron):
         finished_responses: List[IssueSolution],
         process_times: List[float], 
         working_miner_uids: List[int], 
+        miner_hotkeys: List[str],
     ) -> None:
-        miner_hotkeys = [self.metagraph.hotkeys[uid] for uid in working_miner_uids]
+        # The hotkeys come from the responding axons, which match metagraph.hotkeys at those uids
         try:
             rewards_list = await self.calculate_rewards(
                 repo,
@@ -72,7 +72,7 @@ setup(
     include_package_data=True,
     author_email="taogods@proton.me",
     license="MIT",
-    python_requires=">=3.8",
+    python_requires=">=3.10",
     install_requires=[
         # Install nightly version to patch issue with validators crashing in 1.8.0 release
         "websocket-client @ git+https://github.com/websocket-client/websocket-client.git",
@@ -89,6 +89,7 @@ setup(
         "swebench",
         "boto3",
         "openai>=1.0.0",
+        "orjson",
         "pygithub",
         "pytz",
         "posthog",
@@ -236,8 +237,6 @@ setup(
         # Pick your license as you wish
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.8",
-        "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
         "Topic :: Scientific/Engineering",
         "Topic :: Scientific/Engineering :: Mathematics",
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from agentao.helpers.classes import GeneratedProblemStatement, IssueSolution
+from agentao.validator.graders import judge_cache
+from agentao.validator.graders.abstract_grader import MinerSubmission
+from agentao.validator.graders.elo_grader import WinLoss, _get_cached_win_loss, _resolve_trivially, judge_pairs
+from agentao.validator.graders.judge_cache import make_key, set_cached
+
+PROBLEM = GeneratedProblemStatement(
+    prompt="",
+    model="gpt-4o",
+    problem_statement="Fix the off-by-one error",
+    dynamic_checklist=["Fixes the bound"],
+    context_files=[],
+)
+
+
+@pytest.fixture(autouse=True)
+def isolated_judge_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(judge_cache, "JUDGE_CACHE_PATH", tmp_path / "judge")
+    monkeypatch.setattr(judge_cache, "_judge_cache", None)
+    yield
+    if judge_cache._judge_cache is not None:
+        judge_cache._judge_cache.close()
+
+
+def _submission(patch: str) -> MinerSubmission:
+    return MinerSubmission(repo="a/b", problem=PROBLEM, solution=IssueSolution(patch=patch), miner_hotkey=patch)
+
+
+def _cache_verdict(patch_0: str, patch_1: str, output: WinLoss) -> None:
+    problem_text = PROBLEM.to_detailed_format()
+    asyncio.run(set_cached(make_key(problem_text, patch_0, patch_1), output.model_dump_json()))
+
+
+@pytest.mark.parametrize("patch_0, patch_1", [
+    ("+x = 1\n", "+x = 1\n"),
+    ("+x = 1\n", "  +x  =  1\n\n"),
+    ("", ""),
+    ("  \n", "\t"),
+])
+def test_resolve_trivially_draws_identical_patches(patch_0, patch_1):
+    output = _resolve_trivially(patch_0, patch_1)
+
+    assert output.is_draw
+    assert not output.model_1_victor and not output.model_2_victor
+
+
+@pytest.mark.parametrize("empty_patch", ["", " \n\t"])
+def test_resolve_trivially_empty_patch_loses(empty_patch):
+    first_empty = _resolve_trivially(empty_patch, "+x = 1\n")
+    second_empty = _resolve_trivially("+x = 1\n", empty_patch)
+
+    assert first_empty.model_2_victor and not first_empty.model_1_victor and not first_empty.is_draw
+    assert second_empty.model_1_victor and not second_empty.model_2_victor and not second_empty.is_draw
+
+
+def test_resolve_trivially_leaves_real_matches_to_the_judge():
+    assert _resolve_trivially("+x = 1\n", "+x = 2\n") is None
+
+
+def test_cached_verdict_is_reused_for_the_same_pair():
+    output = WinLoss(model_1_victor=True, model_2_victor=False, is_draw=False, explanation="First is better")
+    _cache_verdict("+a\n", "+b\n", output)
+
+    assert asyncio.run(_get_cached_win_loss(PROBLEM.to_detailed_format(), "+a\n", "+b\n")) == output
+
+
+@pytest.mark.parametrize("model_1_victor, model_2_victor, is_draw", [
+    (True, False, False),
+    (False, True, False),
+    (False, False, True),
+])
+def test_cached_verdict_is_inverted_for_the_swapped_pair(model_1_victor, model_2_victor, is_draw):
+    _cache_verdict("+a\n", "+b\n", WinLoss(
+        model_1_victor=model_1_victor, model_2_victor=model_2_victor, is_draw=is_draw, explanation="cached"
+    ))
+
+    swapped = asyncio.run(_get_cached_win_loss(PROBLEM.to_detailed_format(), "+b\n", "+a\n"))
+
+    assert swapped.model_1_victor == model_2_victor
+    assert swapped.model_2_victor == model_1_victor
+    assert swapped.is_draw == is_draw
+
+
+def test_judge_pairs_answers_swapped_pairs_from_the_cache():
+    _cache_verdict("+a\n", "+b\n", WinLoss(
+        model_1_victor=True, model_2_victor=False, is_draw=False, explanation="cached"
+    ))
+
+    # No client: any call to the judge model would fail the test
+    outputs = asyncio.run(judge_pairs(
+        PROBLEM.to_detailed_format(),
+        "",
+        [(_submission("+b\n"), _submission("+a\n"))],
+        openai_client=None,
+        semaphore=asyncio.Semaphore(1),
+    ))
+
+    assert [(output.model_1_victor, output.model_2_victor) for output in outputs] == [(False, True)]
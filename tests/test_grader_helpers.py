@@ -0,0 +1,54 @@
+import random
+import re
+
+import pytest
+
+from agentao.validator.graders.helpers import remove_comments
+
+
+def _remove_comments_regex(patch_content: str) -> str:
+    """The original regex implementation, kept as the reference behaviour"""
+    comment_line_pattern = re.compile(r"^\+\s*#.*")
+    inline_comment_pattern = re.compile(r"#.*")
+
+    cleaned_lines = []
+    for line in patch_content.splitlines():
+        if line.startswith('+'):
+            if comment_line_pattern.match(line):
+                continue
+            cleaned_lines.append(inline_comment_pattern.sub("", line).rstrip())
+        else:
+            cleaned_lines.append(line)
+
+    return "\n".join(cleaned_lines)
+
+
+@pytest.mark.parametrize("patch", [
+    "",
+    "+",
+    "+#",
+    "+# whole-line comment",
+    "+    # indented comment",
+    "+\t# tab-indented comment",
+    "+x = 1  # inline comment",
+    "+x = 1   ",
+    "+s = '# not really a comment'",
+    "+x = 1 # first # second",
+    "+++ b/src/main.py",
+    "-# removed comment",
+    " # context comment",
+    "diff --git a/src/main.py b/src/main.py\n--- a/src/main.py\n+++ b/src/main.py\n@@ -1,2 +1,3 @@\n"
+    " def f():\n-    return 1  # old\n+    # explain\n+    return 2  # new\n",
+    "+x = 1\r\n+# comment\r\n+y = 2",
+    "+　# comment after ideographic space",
+])
+def test_remove_comments_matches_regex(patch):
+    assert remove_comments(patch) == _remove_comments_regex(patch)
+
+
+def test_remove_comments_matches_regex_on_random_patches():
+    rng = random.Random(0)
+    alphabet = ["+", "-", " ", "\t", "#", "x", "=", "1", "'", "\n", " "]
+    for _ in range(2000):
+        patch = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert remove_comments(patch) == _remove_comments_regex(patch)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from agentao.helpers.constants import MODEL_ALIASES, PRICING_DATA_PER_MILLION_TOKENS
+from agentao.helpers.helpers import calculate_price, exponential_decay, exponential_decay_batch
+
+
+def _nested_price(model_name: str, input_tokens: int, output_tokens: int, modality: str) -> float:
+    """Prices straight from the nested table, as calculate_price did before the flat table"""
+    prices = PRICING_DATA_PER_MILLION_TOKENS[MODEL_ALIASES.get(model_name, model_name)]
+    if "input" not in prices:
+        prices = prices[modality]
+    return (input_tokens * prices["input"] + output_tokens * prices["output"]) / 1e6
+
+
+@pytest.mark.parametrize("model_name", [*PRICING_DATA_PER_MILLION_TOKENS, *MODEL_ALIASES])
+def test_flat_pricing_matches_nested_table(model_name):
+    for input_tokens, output_tokens in [(0, 0), (1, 0), (0, 1), (1234, 567), (10**6, 10**6)]:
+        assert calculate_price(model_name, input_tokens, output_tokens) == pytest.approx(
+            _nested_price(model_name, input_tokens, output_tokens, "text")
+        )
+
+
+def test_flat_pricing_prices_each_modality():
+    assert calculate_price("gpt-4o-audio-preview-2024-10-01", 1000, 2000, modality="audio") == pytest.approx(
+        _nested_price("gpt-4o-audio-preview", 1000, 2000, "audio")
+    )
+
+
+def test_flat_pricing_rejects_unknown_models():
+    with pytest.raises(KeyError):
+        calculate_price("not-a-model", 1, 1)
+
+
+@pytest.mark.parametrize("N", [1, 10, 2.5, 1000])
+def test_exponential_decay_batch_matches_scalar(N):
+    xs = np.concatenate([
+        np.linspace(-N, 2 * N, 301),
+        [0, N, N - 1e-9, N + 1e-9],
+        np.random.default_rng(0).uniform(0, N, 100),
+    ])
+
+    expected = [exponential_decay(N, x) for x in xs]
+
+    np.testing.assert_allclose(exponential_decay_batch(N, xs), expected, rtol=1e-12, atol=0)
+
+
+def test_exponential_decay_batch_accepts_lists():
+    np.testing.assert_array_equal(exponential_decay_batch(10, [0, 10, 20]), [1., 0., 0.])
@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pytest
+
+# The module builds its OpenAI client at import time; no request is made in these tests
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from agentao.helpers.classes import EmbeddedFile
+from agentao.validator import ingest
+
+
+def _embedded_files(n: int, dim: int = 16, seed: int = 0):
+    embeddings = np.random.default_rng(seed).standard_normal((n, dim))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return [
+        EmbeddedFile(path=f"file_{i}.py", contents="", embedding=embedding.astype(ingest.EMBEDDING_DTYPE))
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def _paths(pair):
+    return [f.path for f in pair.files]
+
+
+def _most_similar_pair_full_matrix(embedded_files):
+    embeddings = np.asarray([f.embedding for f in embedded_files], dtype=np.float32)
+    similarities = embeddings @ embeddings.T
+    rows, cols = np.triu_indices(len(embedded_files), k=1)
+    best = int(np.argmax(similarities[rows, cols]))
+    return similarities[rows[best], cols[best]], rows[best], cols[best]
+
+
+@pytest.mark.parametrize("n", [ingest.SIMILARITY_BLOCK_SIZE + 1, 2 * ingest.SIMILARITY_BLOCK_SIZE + 37])
+def test_blocked_similarity_matches_full_matrix(n):
+    embedded_files = _embedded_files(n)
+    similarity, i, j = _most_similar_pair_full_matrix(embedded_files)
+
+    pair = ingest._find_most_similar_files(embedded_files)
+
+    assert _paths(pair) == [f"file_{i}.py", f"file_{j}.py"]
+    assert pair.cosine_similarity == pytest.approx(float(similarity))
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64])
+def test_blocked_similarity_matches_full_matrix_for_any_block_size(monkeypatch, block_size):
+    embedded_files = _embedded_files(100, seed=block_size)
+    expected = ingest._find_most_similar_files(embedded_files)
+
+    monkeypatch.setattr(ingest, "SIMILARITY_BLOCK_SIZE", block_size)
+    pair = ingest._find_most_similar_files(embedded_files)
+
+    assert _paths(pair) == _paths(expected)
+    assert pair.cosine_similarity == pytest.approx(expected.cosine_similarity)
+
+
+def test_blocked_similarity_breaks_ties_like_full_matrix(monkeypatch):
+    # Every pair is equally similar, so both paths must settle on the first pair
+    embedding = _embedded_files(1)[0].embedding
+    embedded_files = [EmbeddedFile(path=f"file_{i}.py", contents="", embedding=embedding) for i in range(10)]
+    expected = ingest._find_most_similar_files(embedded_files)
+
+    monkeypatch.setattr(ingest, "SIMILARITY_BLOCK_SIZE", 3)
+    pair = ingest._find_most_similar_files(embedded_files)
+
+    assert _paths(expected) == ["file_0.py", "file_1.py"]
+    assert _paths(pair) == _paths(expected)
+
+
+@pytest.fixture
+def embedded_contents(monkeypatch, tmp_path):
+    """Runs ingestion in a temporary directory, with a fake embedding model that records its inputs"""
+    monkeypatch.chdir(tmp_path)
+    embedded = []
+
+    def fake_embed_code(raw_codes):
+        embedded.extend(raw_codes)
+        return np.asarray([_embedded_files(1, seed=len(code))[0].embedding for code in raw_codes])
+
+    monkeypatch.setattr(ingest, "_embed_code", fake_embed_code)
+    return embedded
+
+
+def _write_repo(repo, contents_by_dir):
+    for dir_name, contents in contents_by_dir.items():
+        (repo / dir_name).mkdir(parents=True, exist_ok=True)
+        for i, content in enumerate(contents):
+            (repo / dir_name / f"file_{i}.py").write_text(content)
+
+
+def test_filepair_cache_only_embeds_changed_files(tmp_path, embedded_contents):
+    repo = tmp_path / "repo"
+    _write_repo(repo, {"a": [f"a{i}" * (30 + i) for i in range(6)], "b": [f"b{i}" * (30 + i) for i in range(6)]})
+
+    first = ingest.get_all_filepairs(repo)
+    assert len(embedded_contents) == 12
+
+    second = ingest.get_all_filepairs(repo)
+    assert len(embedded_contents) == 12
+    assert [_paths(pair) for pair in second] == [_paths(pair) for pair in first]
+
+    (repo / "a" / "file_0.py").write_text("changed" * 20)
+    ingest.get_all_filepairs(repo)
+    assert embedded_contents[12:] == ["changed" * 20]
+
+
+def test_filepair_cache_refresh_reembeds_everything(tmp_path, embedded_contents):
+    repo = tmp_path / "repo"
+    _write_repo(repo, {"a": [f"a{i}" * (30 + i) for i in range(6)]})
+
+    ingest.get_all_filepairs(repo)
+    ingest.get_all_filepairs(repo, refresh=True)
+
+    assert len(embedded_contents) == 12
+
+
+def test_filepair_cache_drops_removed_directories(tmp_path, embedded_contents):
+    repo = tmp_path / "repo"
+    _write_repo(repo, {"a": [f"a{i}" * (30 + i) for i in range(6)], "b": [f"b{i}" * (30 + i) for i in range(6)]})
+    ingest.get_all_filepairs(repo)
+
+    for path in (repo / "b").iterdir():
+        path.unlink()
+    (repo / "b").rmdir()
+    ingest.get_all_filepairs(repo)
+
+    cached_dirs, cached_embeddings = ingest.load_filepairs_from_cache(f".cache/{repo}")
+    assert list(cached_dirs) == [str(repo / "a")]
+    assert len(cached_embeddings) == 6
+
+
+def test_filepair_cache_ignores_unreadable_index(tmp_path):
+    cache_path = tmp_path / "cache"
+    (tmp_path / "cache.json").write_bytes(b'{"signature": "old format"}')
+
+    assert ingest.load_filepairs_from_cache(str(cache_path)) == ({}, {})
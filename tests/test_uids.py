@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from agentao.utils.uids import check_uid_availability, get_available_uids
+
+
+def _metagraph(n: int, seed: int) -> SimpleNamespace:
+    rng = np.random.default_rng(seed)
+    return SimpleNamespace(
+        axons=[SimpleNamespace(is_serving=bool(serving)) for serving in rng.random(n) < 0.7],
+        validator_permit=rng.random(n) < 0.3,
+        S=rng.choice([0., 512., 1024., 1024.5, 4096.], size=n),
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("vpermit_tao_limit", [0, 1024, 10_000])
+def test_get_available_uids_matches_check_uid_availability(seed, vpermit_tao_limit):
+    metagraph = _metagraph(n=64 + seed, seed=seed)
+
+    expected = [
+        uid for uid in range(len(metagraph.axons))
+        if check_uid_availability(metagraph, uid, vpermit_tao_limit)
+    ]
+
+    np.testing.assert_array_equal(get_available_uids(metagraph, vpermit_tao_limit), expected)
+
+
+def test_get_available_uids_empty_metagraph():
+    metagraph = SimpleNamespace(axons=[], validator_permit=np.zeros(0, dtype=bool), S=np.zeros(0))
+
+    assert get_available_uids(metagraph, 1024).size == 0